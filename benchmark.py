@@ -0,0 +1,238 @@
+""" benchmark v0.1
+Render benchmark for raspi-cloudlamp animations
+
+Runs a fixed number of frames of every animation in animations.mode, wth_list and
+lightning_list against the pixel backend (the simulated strip unless CLOUDLAMP_BACKEND
+is set) and reports the achievable fps, draw+show time percentiles and allocations
+per frame.  Results can be saved as JSON and compared against a stored baseline.
+With --spi the WS2812 SPI encoding of a frame is also timed, bit by bit against the
+ENCODING table, and written to os.devnull through SPIPixels.
+
+Use:
+    python3 benchmark.py --frames 500 --output bench.json
+    python3 benchmark.py --baseline bench.json
+    python3 benchmark.py --spi --only
+"""
+
+# Standard library imports
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+os.environ.setdefault("CLOUDLAMP_BACKEND", "sim")
+
+# Application library imports
+from cloud_animations import animations, backend, lightning_animations, pixel_num
+from cloud_animations import spi
+from cloud_animations.timing import leaves
+
+
+def named_animations():
+    """Returns a list of (name, animation) for every animation the lamp can show, without duplicates."""
+    names = {}
+    for module in (lightning_animations, animations):
+        for name, value in vars(module).items():
+            if hasattr(value, "animate") and not name.startswith("_"):
+                names.setdefault(id(value), name)
+
+    found = []
+    seen = set()
+    candidates = (
+        [entry[0] for entry in animations.mode]
+        + animations.wth_list
+        + lightning_animations.lightning_list
+    )
+    for anim in candidates:
+        if id(anim) in seen:
+            continue
+        seen.add(id(anim))
+        found.append((names.get(id(anim), type(anim).__name__), anim))
+    return found
+
+
+def force_frame(anim):
+    """Marks every animation driving anim as due so the next animate() draws a frame."""
+    for leaf in leaves(anim):
+        leaf._next_update = 0
+
+
+def percentile(ordered, pct):
+    """Returns the nearest-rank percentile pct of the sorted list ordered."""
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def bench_animation(anim, frames, warmup=10):
+    """Returns a dict of frame time and allocation statistics for frames frames of anim."""
+    anim.reset()
+    for _ in range(warmup):
+        force_frame(anim)
+        anim.animate()
+
+    # Timing pass
+    times = []
+    for _ in range(frames):
+        force_frame(anim)
+        start = perf_counter()
+        anim.animate()
+        times.append(perf_counter() - start)
+
+    # Allocation pass - net blocks retained, and peak bytes allocated within a frame
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        for _ in range(frames):
+            force_frame(anim)
+            anim.animate()
+        blocks = sys.getallocatedblocks() - blocks
+
+        peak_bytes = None
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.start()
+            peak_bytes = 0
+            for _ in range(frames):
+                force_frame(anim)
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                anim.animate()
+                peak_bytes += tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+            peak_bytes /= frames
+    finally:
+        gc.enable()
+
+    times.sort()
+    total = sum(times)
+    return {
+        "frames": frames,
+        "fps": frames / total if total else None,
+        "mean_ms": total / frames * 1000,
+        "p50_ms": percentile(times, 50) * 1000,
+        "p95_ms": percentile(times, 95) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "max_ms": times[-1] * 1000,
+        "blocks_per_frame": blocks / frames,
+        "alloc_bytes_per_frame": peak_bytes,
+    }
+
+
+def bench_spi(frames):
+    """Returns a dict of the mean microseconds taken to SPI encode (and write) a frame of pixel_num pixels."""
+    frame = bytes(random.randrange(256) for _ in range(3 * pixel_num))
+    out = bytearray(9 * pixel_num)
+    with open(os.devnull, "wb") as device:
+        strip = spi.SPIPixels(pixel_num, device, auto_write=False)
+        strip.set_frame(frame)
+        if spi.encode(frame) != spi.encode_bits(frame):
+            raise AssertionError("SPI table encoding differs from bit by bit encoding")
+
+        cases = {
+            "per_bit": lambda: spi.encode_bits(frame),
+            "table": lambda: spi.encode(frame),
+            "table_into": lambda: spi.encode(frame, out),
+            "show": strip.show,
+        }
+        stats = {}
+        for name, case in cases.items():
+            start = perf_counter()
+            for _ in range(frames):
+                case()
+            stats[f"{name}_us"] = (perf_counter() - start) / frames * 1e6
+        strip.deinit()
+    stats["speedup"] = stats["per_bit_us"] / stats["table_into_us"]
+    return stats
+
+
+def compare(results, baseline, threshold):
+    """Prints the change in p50/p95 against baseline and returns the names of regressed animations."""
+    regressed = []
+    print(f"\n{'animation':<18} {'p50 change':>11} {'p95 change':>11}")
+    for name, stats in results["animations"].items():
+        base = baseline["animations"].get(name)
+        if base is None:
+            print(f"{name:<18} {'(new)':>11}")
+            continue
+        changes = [
+            (stats[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            for key in ("p50_ms", "p95_ms")
+        ]
+        flag = ""
+        if max(changes) > threshold:
+            flag = "  REGRESSION"
+            regressed.append(name)
+        print(f"{name:<18} {changes[0]:>+10.1f}% {changes[1]:>+10.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=300, help="frames per animation")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="percent slowdown in p50/p95 reported as a regression",
+    )
+    parser.add_argument(
+        "--only", nargs="*", help="only run these animations (none if no names)"
+    )
+    parser.add_argument(
+        "--spi", action="store_true", help="also time the WS2812 SPI encoding"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "backend": backend,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "frames": args.frames,
+        "animations": {},
+    }
+
+    print(
+        f"{'animation':<18} {'fps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'blocks':>7} {'bytes':>8}"
+    )
+    for name, anim in named_animations():
+        if args.only is not None and name not in args.only:
+            continue
+        stats = bench_animation(anim, args.frames)
+        results["animations"][name] = stats
+        alloc = stats["alloc_bytes_per_frame"]
+        print(
+            f"{name:<18} {stats['fps']:>9.0f} {stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} "
+            f"{stats['p99_ms']:>8.3f} {stats['blocks_per_frame']:>7.2f} "
+            f"{'-' if alloc is None else format(alloc, '.0f'):>8}"
+        )
+
+    if args.spi:
+        stats = bench_spi(args.frames)
+        results["spi"] = stats
+        print(
+            f"\nSPI encode of {pixel_num} pixels: {stats['per_bit_us']:.1f} us bit by bit, "
+            f"{stats['table_us']:.1f} us table, {stats['table_into_us']:.1f} us table into buffer "
+            f"({stats['speedup']:.0f}x), {stats['show_us']:.1f} us show()"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
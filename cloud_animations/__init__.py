@@ -2,20 +2,50 @@
 Main init file for raspi-cloudlamp animations
 """
 
-import board
-import neopixel
+import os
 
 from adafruit_led_animation.color import WHITE, calculate_intensity
 
 from mylog import get_logger
 
+from .framebuffer import FrameBuffer
+
 logger = get_logger(__name__)
 
-# Setup NeoPixels
-logger.info("Initializing NeoPixels . . .")
-pixel_pin = board.D18
+# Pixel backend - "neopixel" (default), "spi" for NeoPixels on SPI, or "sim" for the in-memory simulated strip
+backend = os.environ.get("CLOUDLAMP_BACKEND", "neopixel")
 pixel_num = 48
-pixels = neopixel.NeoPixel(pixel_pin, pixel_num, brightness=0.5, auto_write=False)
+
+if backend == "sim":
+    from .simulated import SimulatedPixels, SimulatedGPIO
+
+    logger.info("Initializing simulated pixels . . .")
+    strip = SimulatedPixels(pixel_num, auto_write=False)
+    GPIO = SimulatedGPIO()
+elif backend == "spi":
+    from .simulated import SimulatedGPIO
+    from .spi import SPIPixels
+
+    # NeoPixel data on the SPI MOSI pin - no GPIO or root access needed
+    logger.info("Initializing SPI pixels . . .")
+    strip = SPIPixels(
+        pixel_num,
+        os.environ.get("CLOUDLAMP_SPI_DEVICE", "/dev/spidev0.0"),
+        auto_write=False,
+    )
+    GPIO = SimulatedGPIO()
+else:
+    import board
+    import neopixel
+
+    # Setup NeoPixels
+    logger.info("Initializing NeoPixels . . .")
+    pixel_pin = board.D18
+    strip = neopixel.NeoPixel(pixel_pin, pixel_num, auto_write=False)
+    GPIO = board.pin.GPIO
+
+# Animations draw to pixels, which scales changed frames by brightness and writes them out to the strip
+pixels = FrameBuffer(strip, brightness=0.5)
 
 # Custom colors
 DULL_WHITE = calculate_intensity(WHITE, 0.1)
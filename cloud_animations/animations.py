@@ -2,7 +2,6 @@
 Contains animations for weather patterns and others
 except lightning which is in lightning_animations module. """
 
-from adafruit_led_animation.group import AnimationGroup
 from adafruit_led_animation.color import (
     RED,
     YELLOW,
@@ -14,13 +13,15 @@ from adafruit_led_animation.color import (
 )
 from adafruit_led_animation.animation.comet import Comet
 from adafruit_led_animation.animation.pulse import Pulse
-from adafruit_led_animation.animation.sparkle import Sparkle
 from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle
 from adafruit_led_animation.animation.solid import Solid
 from adafruit_led_animation.animation.rainbow import Rainbow
 
 from . import pixels, DULL_WHITE
+from .baked import Baked
+from .compositor import Layer, Scene
 from .drops import Drops
+from .sparkle import Sparkle
 from .groups import (
     cross_strips,
     hatch_strips,
@@ -32,114 +33,144 @@ from .groups import (
     cloudy75,
     top_half,
     rain_pixels,
+    on_layer,
 )
 from .lightning_animations import lightning_list
 from mylog import get_logger
 
 logger = get_logger(__name__)
 
-# Weather Animations
+# Weather Animations - multi-layer scenes draw each layer into its own buffer and
+# composite them onto pixels (see compositor)
 clearday = Solid(pixels, color=YELLOW)
 
-cloud25 = AnimationGroup(
-    Solid(sunny75, color=YELLOW), Solid(cloudy25, color=DULL_WHITE), sync=True
+cloud25 = Scene(
+    pixels,
+    Layer(Solid(on_layer(sunny75), color=YELLOW)),
+    Layer(Solid(on_layer(cloudy25), color=DULL_WHITE)),
 )
 
-cloud50 = AnimationGroup(
-    Solid(sunny50, color=YELLOW), Solid(cloudy50, color=DULL_WHITE), sync=True
+cloud50 = Scene(
+    pixels,
+    Layer(Solid(on_layer(sunny50), color=YELLOW)),
+    Layer(Solid(on_layer(cloudy50), color=DULL_WHITE)),
 )
 
-cloud75 = AnimationGroup(
-    Solid(sunny25, color=YELLOW), Solid(cloudy75, color=DULL_WHITE), sync=True
+cloud75 = Scene(
+    pixels,
+    Layer(Solid(on_layer(sunny25), color=YELLOW)),
+    Layer(Solid(on_layer(cloudy75), color=DULL_WHITE)),
 )
 
 cloud100 = Solid(pixels, color=DULL_WHITE)
 
-rainlight = AnimationGroup(
-    Solid(top_half, color=DULL_WHITE),
-    Drops(
-        rain_pixels, speed=0.1, min_period=2, color=BLUE, count=4, background=DULL_WHITE
+rainlight = Scene(
+    pixels,
+    Layer(Solid(on_layer(top_half), color=DULL_WHITE)),
+    Layer(
+        Drops(
+            on_layer(rain_pixels),
+            speed=0.1,
+            min_period=2,
+            color=BLUE,
+            count=4,
+            background=DULL_WHITE,
+        )
     ),
-    sync=False,
 )
 
-rainheavy = AnimationGroup(
-    Solid(top_half, color=DULL_WHITE),
-    Drops(
-        rain_pixels,
-        speed=0.1,
-        color=BLUE,
-        max_period=5,
-        count=10,
-        background=DULL_WHITE,
+rainheavy = Scene(
+    pixels,
+    Layer(Solid(on_layer(top_half), color=DULL_WHITE)),
+    Layer(
+        Drops(
+            on_layer(rain_pixels),
+            speed=0.1,
+            color=BLUE,
+            max_period=5,
+            count=10,
+            background=DULL_WHITE,
+        )
     ),
-    sync=False,
 )
 
-rainveryheavy = AnimationGroup(
-    Solid(top_half, color=DULL_WHITE),
-    Drops(
-        rain_pixels,
-        speed=0.1,
-        color=BLUE,
-        max_period=4,
-        count=16,
-        background=DULL_WHITE,
+rainveryheavy = Scene(
+    pixels,
+    Layer(Solid(on_layer(top_half), color=DULL_WHITE)),
+    Layer(
+        Drops(
+            on_layer(rain_pixels),
+            speed=0.1,
+            color=BLUE,
+            max_period=4,
+            count=16,
+            background=DULL_WHITE,
+        )
     ),
-    sync=False,
 )
 
-snowlight = AnimationGroup(
-    Solid(top_half, color=DULL_WHITE),
-    Drops(
-        rain_pixels,
-        speed=0.1,
-        color=WHITE,
-        min_period=2,
-        count=4,
-        background=DULL_WHITE,
+snowlight = Scene(
+    pixels,
+    Layer(Solid(on_layer(top_half), color=DULL_WHITE)),
+    Layer(
+        Drops(
+            on_layer(rain_pixels),
+            speed=0.1,
+            color=WHITE,
+            min_period=2,
+            count=4,
+            background=DULL_WHITE,
+        )
     ),
-    sync=False,
 )
 
-snowheavy = AnimationGroup(
-    Solid(top_half, color=DULL_WHITE),
-    Drops(
-        rain_pixels,
-        speed=0.1,
-        color=WHITE,
-        max_period=5,
-        count=10,
-        background=DULL_WHITE,
+snowheavy = Scene(
+    pixels,
+    Layer(Solid(on_layer(top_half), color=DULL_WHITE)),
+    Layer(
+        Drops(
+            on_layer(rain_pixels),
+            speed=0.1,
+            color=WHITE,
+            max_period=5,
+            count=10,
+            background=DULL_WHITE,
+        )
     ),
-    sync=False,
 )
 
-snowveryheavy = AnimationGroup(
-    Solid(top_half, color=DULL_WHITE),
-    Drops(
-        rain_pixels,
-        speed=0.1,
-        color=WHITE,
-        max_period=4,
-        count=16,
-        background=DULL_WHITE,
+snowveryheavy = Scene(
+    pixels,
+    Layer(Solid(on_layer(top_half), color=DULL_WHITE)),
+    Layer(
+        Drops(
+            on_layer(rain_pixels),
+            speed=0.1,
+            color=WHITE,
+            max_period=4,
+            count=16,
+            background=DULL_WHITE,
+        )
     ),
-    sync=False,
 )
 
 solid = Solid(pixels, color=RED)
-rainbow = Rainbow(pixels, speed=0.1, period=2)
-pulse = Pulse(pixels, speed=0.1, period=6, color=RED)
+# Periodic animations are baked into frame tables after their first period
+rainbow = Baked(Rainbow(pixels, speed=0.1, period=2), pixels)
+pulse = Baked(Pulse(pixels, speed=0.1, period=6, color=RED), pixels)
 sparkle = Sparkle(pixels, speed=0.1, color=RED, num_sparkles=10)
 r_sparkle = RainbowSparkle(pixels, speed=0.1, num_sparkles=15)
 
-c_scan = Comet(
-    cross_strips, speed=0.2, color=PURPLE, tail_length=3, bounce=False, ring=True
+c_scan = Baked(
+    Comet(
+        cross_strips, speed=0.2, color=PURPLE, tail_length=3, bounce=False, ring=True
+    ),
+    pixels,
 )
 
-h_scan = Comet(
-    hatch_strips, speed=0.2, color=JADE, tail_length=4, bounce=False, ring=True
+h_scan = Baked(
+    Comet(hatch_strips, speed=0.2, color=JADE, tail_length=4, bounce=False, ring=True),
+    pixels,
 )
 
 reset_strip = Solid(pixels, color=BLACK)
@@ -0,0 +1,218 @@
+""" baked v0.1
+Baked frame tables for periodic, deterministic animations
+
+A Baked animation wraps an animation whose output only depends on its phase
+(rainbow, pulse, ring comets).  On its first frame a whole period is drawn at
+once and each frame captured from the strip, then frames are played back from
+the table with a single buffer copy per frame.  Tables are kept in a FrameCache,
+keyed by the animation parameters and color, with LRU eviction.
+
+While baking, the animation reads the time from a SteppedClock that advances
+exactly its speed per frame, so time-driven animations (rainbow, pulse) are
+baked evenly however late frames are or however much the governor slows them,
+and the table loops without a glitch.
+"""
+
+import sys
+from collections import OrderedDict
+
+from adafruit_led_animation import monotonic_ms
+from adafruit_led_animation.animation import Animation
+
+from mylog import get_logger
+
+logger = get_logger(__name__)
+
+
+class FrameCache(object):
+    """Class for an LRU cache of baked frame tables bounded by size in bytes"""
+
+    def __init__(self, max_bytes=512 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tables = OrderedDict()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def get(self, key):
+        """ Returns the frame table for key (marking it recently used), or None """
+        table = self._tables.get(key)
+        if table is None:
+            self.misses += 1
+            return None
+        self._tables.move_to_end(key)
+        self.hits += 1
+        return table
+
+    def put(self, key, table):
+        """ Stores table (a bytes object of whole frames) for key, evicting the least recently used tables to stay within max_bytes """
+        if key in self._tables:
+            self.size -= len(self._tables.pop(key))
+        self._tables[key] = table
+        self.size += len(table)
+        while self.size > self.max_bytes and len(self._tables) > 1:
+            _, evicted = self._tables.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._tables.clear()
+        self.size = 0
+
+
+frame_cache = FrameCache()
+
+
+class Baked(Animation):
+    """
+    Plays back a baked frame table of a periodic animation.
+    :param animation: The periodic animation to bake.  It must draw to strip (directly or
+                      through an IndexGroup covering every pixel of strip).
+    :param strip: The pixel object frames are captured from and copied into.
+    :param int period_frames: Number of frames in one period.  Defaults to the animation's
+                              period divided by its speed, or the length of its pixel object.
+    :param cache: The FrameCache tables are stored in (Default module frame_cache).
+    """
+
+    def __init__(
+        self, animation, strip, period_frames=None, cache=frame_cache, name=None
+    ):
+        if period_frames is None:
+            period = getattr(animation, "period", None)
+            if period is not None:
+                period_frames = round(period / animation.speed)
+            else:
+                period_frames = len(animation.pixel_object)
+        self._source = animation
+        self._strip = strip
+        self._cache = cache
+        self._period_frames = period_frames
+        self._frame_size = 3 * len(strip)
+        self._params = (
+            type(animation).__name__,
+            id(animation.pixel_object),
+            animation.speed,
+            period_frames,
+            getattr(animation, "_tail_length", None),
+        )
+        self._table = None
+        self._index = 0
+        super().__init__(strip, animation.speed, animation.color, name=name)
+        if animation.color is None:
+            # The color setter skips _set_color when the color is None
+            self._load()
+
+    on_cycle_complete_supported = True
+
+    def _set_color(self, color):
+        self._color = color
+        self._source.color = color
+        self._load()
+
+    def draw(self):
+        if self._table is None:
+            self._bake()
+        start = self._index * self._frame_size
+        write_frame(self._strip, self._table[start : start + self._frame_size])
+        self._index += 1
+        if self._index == self._period_frames:
+            self._index = 0
+            self.cycle_complete = True
+
+    def skip(self, frames):
+        """
+        Advances playback by frames without drawing them.
+        """
+        if self._table is None:
+            return
+        index = self._index + frames
+        if index >= self._period_frames:
+            self.cycle_complete = True
+        self._index = index % self._period_frames
+
+    def reset(self):
+        """
+        Restarts playback from the start of the period.
+        """
+        self._index = 0
+
+    def _key(self):
+        return self._params + (None if self._color is None else tuple(self._color),)
+
+    def _load(self):
+        # Baked on the next draw() if not cached
+        self._table = self._cache.get(self._key())
+        self._index = 0
+
+    def _bake(self):
+        """Draws a whole period of the source, speed apart on a SteppedClock, into a frame table"""
+        source = self._source
+        # Start from a clean strip so pixels the source hasn't reached yet are captured as background
+        self._strip.fill(getattr(source, "_background_color", 0))
+        frames = []
+        with SteppedClock(source) as clock:
+            source.reset()
+            for _ in range(self._period_frames):
+                source.draw()
+                frames.append(read_frame(self._strip))
+                clock.now += source._speed_ms
+        self._table = b"".join(frames)
+        self._cache.put(self._key(), self._table)
+        logger.debug(f"Baked {self._period_frames} frames for {self._key()}")
+
+
+class SteppedClock(object):
+    """Class for a stand-in monotonic_ms, set by the caller, for an animation being baked
+
+    Within a with block it replaces monotonic_ms in the LED animation library
+    modules and the animation's own module, which is where animations read the
+    time from.
+    """
+
+    def __init__(self, animation):
+        self.now = monotonic_ms()
+        self._modules = [
+            module
+            for name, module in list(sys.modules.items())
+            if (
+                name.startswith("adafruit_led_animation")
+                or name == type(animation).__module__
+            )
+            and callable(getattr(module, "monotonic_ms", None))
+        ]
+        self._saved = []
+
+    def __call__(self):
+        return self.now
+
+    def __enter__(self):
+        self._saved = [module.monotonic_ms for module in self._modules]
+        for module in self._modules:
+            module.monotonic_ms = self
+        return self
+
+    def __exit__(self, *exc):
+        for module, saved in zip(self._modules, self._saved):
+            module.monotonic_ms = saved
+        return False
+
+
+def read_frame(strip):
+    """Returns the RGB bytes of every pixel in strip."""
+    get_frame = getattr(strip, "get_frame", None)
+    if get_frame is not None:
+        return get_frame()
+    return bytes(c for pixel in strip[0 : len(strip)] for c in pixel[:3])
+
+
+def write_frame(strip, frame):
+    """Sets every pixel in strip from the RGB bytes frame."""
+    set_frame = getattr(strip, "set_frame", None)
+    if set_frame is not None:
+        set_frame(frame)
+        return
+    strip[0 : len(strip)] = [tuple(frame[i : i + 3]) for i in range(0, len(frame), 3)]
@@ -1,5 +1,8 @@
-""" colorhandler v0.2
+""" colorhandler v0.3
 Color handler for raspi-cloudlamp
+
+Intensity is not applied to color, it is applied at output by the
+FrameBuffer lookup table (see current_intensity).
 """
 
 from adafruit_led_animation import color
@@ -35,7 +38,11 @@ class ColorHandler(object):
 
     @property
     def color(self):
-        return self._set_intensity(self._color)
+        return self._color
+
+    @property
+    def current_intensity(self):
+        return self._intensity
 
     @color.setter
     def color(self, value):
@@ -78,10 +85,3 @@ class ColorHandler(object):
         if value < 0.0 or value > 1.0:
             return
         self._intensity = value
-
-    def _set_intensity(self, color):
-        return (
-            int(color[0] * self._intensity),
-            int(color[1] * self._intensity),
-            int(color[2] * self._intensity),
-        )
@@ -0,0 +1,20 @@
+""" colors v0.1
+Color conversions shared by the pixel buffers and animations
+
+Colors are given the way the LED animation library takes them, as (r, g, b)
+tuples (any extra channels are ignored) or 0xRRGGBB ints.
+"""
+
+
+def rgb(color):
+    """ Returns color ((r, g, b) or 0xRRGGBB) as an (r, g, b) tuple of ints """
+    if isinstance(color, int):
+        return (color >> 16 & 0xFF, color >> 8 & 0xFF, color & 0xFF)
+    return (int(color[0]), int(color[1]), int(color[2]))
+
+
+def pack_color(color):
+    """ Returns color ((r, g, b) or 0xRRGGBB) as a 0xRRGGBB int """
+    if isinstance(color, int):
+        return color
+    return int(color[0]) << 16 | int(color[1]) << 8 | int(color[2])
@@ -0,0 +1,123 @@
+""" compositor v0.1
+Layered scenes composited into the output frame
+
+Each Layer's animation draws into a LayerBuffer (an in-memory frame) instead of
+the strip.  A Scene animates its layers and, on frames where at least one layer
+drew, composites the layers it owns in order and writes the result to its pixel
+object in a single write.  Layers only affect the pixels their animation's pixel
+object covers, and are blended with one of:
+
+    over    the layer replaces what is below it
+    alpha   the layer is mixed with what is below it by alpha
+    add     the layer (times alpha) is added to what is below it
+    max     the brighter of the layer (times alpha) and what is below it
+"""
+
+import numpy as np
+
+from adafruit_led_animation.group import AnimationGroup
+
+from .framebuffer import PixelBuffer
+
+BLENDS = ("over", "alpha", "add", "max")
+
+
+class LayerBuffer(PixelBuffer):
+    """Class for the in-memory frame a Layer draws into
+
+    show() marks the buffer dirty, so the Scene knows to recomposite.
+    """
+
+    def __init__(self, n):
+        super().__init__(n)
+        self.dirty = True
+
+    def show(self):
+        self.dirty = True
+
+
+class Layer(object):
+    """
+    An animation drawn into a LayerBuffer, and how it is blended into a Scene.
+    :param animation: The animation.  Its pixel object must be a LayerBuffer, or an
+                      IndexGroup of one.
+    :param str blend: One of "over", "alpha", "add" or "max" (Default "over").
+    :param float alpha: Layer opacity for the alpha, add and max blends (Default 1.0).
+    """
+
+    def __init__(self, animation, blend="over", alpha=1.0):
+        if blend not in BLENDS:
+            raise ValueError(f"Unknown blend {blend}, expected one of {BLENDS}")
+        self.animation = animation
+        self.blend = blend
+        self.alpha = alpha
+        self.buffer, self.indices = pixel_indices(animation.pixel_object)
+        if not isinstance(self.buffer, LayerBuffer):
+            raise ValueError("Layer animations must draw to a LayerBuffer")
+
+
+class Scene(AnimationGroup):
+    """
+    Animates a stack of Layers and composites them onto pixel_object.
+    :param pixel_object: The pixel object the composited frame is written to.
+    :param layers: The Layers, bottom first.
+    """
+
+    def __init__(self, pixel_object, *layers, name=None):
+        super().__init__(*(layer.animation for layer in layers), name=name)
+        self.pixel_object = pixel_object
+        self._layers = layers
+        # Every pixel some layer covers, and the composited frame for those pixels
+        self._indices = np.unique(np.concatenate([layer.indices for layer in layers]))
+        self._frame = np.zeros((len(pixel_object), 3), dtype=np.float32)
+
+    def animate(self, show=True):
+        drew = False
+        for layer in self._layers:
+            if layer.animation.animate():
+                drew = True
+        if not any(layer.buffer.dirty for layer in self._layers):
+            return drew
+
+        self.composite()
+        if show:
+            self.pixel_object.show()
+        return drew
+
+    def composite(self):
+        """
+        Blends the layers and writes the covered pixels to pixel_object.
+        """
+        frame = self._frame
+        frame[self._indices] = 0
+        for layer in self._layers:
+            indices = layer.indices
+            src = layer.buffer.rows[indices]
+            if layer.blend == "over":
+                frame[indices] = src
+            elif layer.blend == "alpha":
+                frame[indices] += (src - frame[indices]) * layer.alpha
+            elif layer.blend == "add":
+                frame[indices] = np.minimum(frame[indices] + src * layer.alpha, 255)
+            else:
+                frame[indices] = np.maximum(frame[indices], src * layer.alpha)
+            layer.buffer.dirty = False
+        self.pixel_object.write_indices(
+            self._indices, frame[self._indices].astype(np.uint8)
+        )
+
+    def reset(self):
+        super().reset()
+        for layer in self._layers:
+            layer.buffer.dirty = True
+
+    def show(self):
+        self.pixel_object.show()
+
+
+def pixel_indices(pixel_object):
+    """Returns (strip, index array) of the strip pixels pixel_object (a strip or an IndexGroup of one) covers."""
+    indices = getattr(pixel_object, "indices", None)
+    if indices is None:
+        return pixel_object, np.arange(len(pixel_object))
+    return pixel_object.strip, indices
@@ -19,7 +19,7 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
-""" drops v0.2
+""" drops v0.3
 cloud_animations.drops
 Modified from: `adafruit_led_animation.animation.grid_rain`
 Modified by: Alex P
@@ -37,11 +37,16 @@ Implementation Notes
 """
 
 import random
+
+import numpy as np
+
 from adafruit_led_animation.animation import Animation
 from adafruit_led_animation import MS_PER_SECOND, monotonic_ms
-from adafruit_led_animation.color import calculate_intensity
 from adafruit_led_animation.color import BLACK
 
+from .colors import pack_color, rgb
+from .particles import ParticlePool
+
 
 class Drops(Animation):
     """
@@ -53,6 +58,10 @@ class Drops(Animation):
     :param min_period: Minimum period for pulse (Default 1.0)
     :param max_period: Max period for pulse (Default 6.0)
     :param background: Background color (Default BLACK).
+
+    Each drop fades in from off to color over half its period, then returns to the
+    background.  Drops are particles in a ParticlePool, and every drop is updated
+    in one NumPy pass per frame through views of the pool arrays.
     """
 
     # pylint: disable=too-many-arguments
@@ -70,64 +79,59 @@ class Drops(Animation):
         self._count = count
         self._min_period = min_period
         self._max_period = max_period
-        self._background = background
-        self._drops = []
+        self._background = np.array(rgb(background))
+        self._frame = np.empty((len(pixel_object), 3), dtype=np.float32)
+        self._shifts = np.array([16, 8, 0])
+
+        # NumPy views of the pool arrays, for updating every drop in one pass
+        self._pool = ParticlePool(count, len(pixel_object))
+        self._pixel, self._start, self._half, self._colors = (
+            np.frombuffer(values, dtype=values.typecode)
+            for values in (
+                self._pool.pixel,
+                self._pool.start,
+                self._pool.period,
+                self._pool.color,
+            )
+        )
         super().__init__(pixel_object, speed, color, name=name)
 
     def draw(self):
+        # Go by the time the frame was due (unless it is a period late), so lamps drawing
+        # on the same schedule spawn and retire the same drops (see renderer.Renderer.sync)
+        now = monotonic_ms()
+        if now - self._next_update < self._speed_ms:
+            now = int(self._next_update)
+        pool = self._pool
 
-        # Increase drop intensity
-        keep = []
-        for drop in self._drops:
-            color = next(drop["generator"])
-            if color is not None:
-                drop["color"] = color
-                keep.append(drop)
-            else:
-                self.pixel_object[drop["pixel"]] = self._background
-        self._drops = keep
+        # Retire finished drops, highest slot first so lower slots stay put
+        finished = np.flatnonzero(
+            now - self._start[: pool.count] > self._half[: pool.count]
+        )
+        for slot in finished[::-1].tolist():
+            pool.retire(slot)
 
-        # Add a drop
-        if len(self._drops) < self._count:
-            # create list of pixels not in self._drops
-            used = [drop["pixel"] for drop in self._drops]
-            avail = [n for n in range(len(self.pixel_object)) if n not in used]
-            # randomly pick one from that list
-            d = random.choice(avail)
-            period = random.randint(self._min_period, self._max_period)
-            _generator = pulse_generator(period, self.color)
-            self._drops.append(
-                {
-                    "pixel": d,
-                    "color": self._background,
-                    "generator": _generator,
-                }
+        # Add a drop on a free pixel
+        if pool.count < self._count:
+            period = random.randint(int(self._min_period), int(self._max_period))
+            pool.spawn(
+                now, max(1, int(period * MS_PER_SECOND) // 2), pack_color(self.color)
             )
 
-        # Draw raindrops
-        for drop in self._drops:
-            self.pixel_object[drop["pixel"]] = drop["color"]
-
-
-def pulse_generator(period: float, color):
-    """
-    Generates a sequence of colors for a pulse, based on the time period specified.
-    :param period: Pulse duration in seconds.
-    :param color: RGB Color
-    """
-    period = int(period * MS_PER_SECOND)
-    half_period = period // 2
+        # Draw raindrops over the background and write the whole strip at once
+        num = pool.count
+        intensity = (now - self._start[:num]) / self._half[:num]
+        rgb = (self._colors[:num, None] >> self._shifts) & 0xFF
+        self._frame[:] = self._background
+        self._frame[self._pixel[:num]] = rgb * intensity[:, None]
+        frame = self._frame.astype(np.uint8)
+        if hasattr(self.pixel_object, "write"):
+            self.pixel_object.write(frame)
+        else:
+            self.pixel_object[0 : len(frame)] = [tuple(rgb) for rgb in frame.tolist()]
 
-    last_update = monotonic_ms()
-    cycle_position = 0
-    while True:
-        now = monotonic_ms()
-        time_since_last_draw = now - last_update
-        last_update = now
-        pos = cycle_position = (cycle_position + time_since_last_draw) % period
-        if pos > half_period:
-            cycle_position = 0
-            yield None
-            continue
-        intensity = pos / half_period
-        yield calculate_intensity(color, intensity)
+    def reset(self):
+        """
+        Removes all drops.
+        """
+        self._pool.reset()
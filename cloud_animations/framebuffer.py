@@ -0,0 +1,238 @@
+""" framebuffer v0.3
+Output layer between the animations and the pixel strip
+
+Animations draw into FrameBuffer, which keeps the unscaled frame as RGB bytes.
+On show() the frame is scaled by the current lookup table (intensity x master
+brightness, optionally gamma corrected) in one translate() pass and written to
+the strip, whose own brightness is left at 1.0.  Static modes (clearday,
+cloudNN, solid, reset_strip between lightning bursts) call show() every frame
+with identical data, so show() is skipped when neither the frame nor the table
+has changed since the last write.  crossfade() blends from the last frame
+written to the frames drawn over the following seconds.  The blend is of the
+scaled frames, so an intensity change during a crossfade fades too.
+"""
+
+from time import monotonic
+
+import numpy as np
+
+from mylog import get_logger
+
+from .colors import rgb
+from .lut import scale_table
+
+logger = get_logger(__name__)
+
+
+class PixelBuffer(object):
+    """Class for an in-memory frame of n pixels with the neopixel.NeoPixel API
+
+    The frame is held as RGB bytes in buf, and as an (n, 3) uint8 array view in rows.
+    show() does nothing; subclasses decide what showing a frame means.
+    """
+
+    brightness = 1.0
+
+    def __init__(self, n):
+        self.n = n
+        self.buf = bytearray(3 * n)
+        self.rows = np.frombuffer(self.buf, dtype=np.uint8).reshape(n, 3)
+        self.auto_write = False
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return "[" + ", ".join(str(self[i]) for i in range(self.n)) + "]"
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            indices = range(*index.indices(self.n))
+            if len(value) != len(indices):
+                raise ValueError("Slice and input sequence size do not match.")
+            for i, color in zip(indices, value):
+                self._set(i, color)
+        else:
+            self._set(self._index(index), value)
+        if self.auto_write:
+            self.show()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.n))]
+        i = 3 * self._index(index)
+        return tuple(self.buf[i : i + 3])
+
+    def fill(self, color):
+        self.buf[:] = bytes(rgb(color)) * self.n
+        if self.auto_write:
+            self.show()
+
+    def get_frame(self):
+        """ Returns the RGB bytes of every pixel """
+        return bytes(self.buf)
+
+    def set_frame(self, frame):
+        """ Sets every pixel from the RGB bytes frame """
+        self.buf[:] = frame
+        if self.auto_write:
+            self.show()
+
+    def write_indices(self, indices, colors):
+        """ Sets the pixels in the index array indices from the matching rows of the (len(indices), 3) uint8 array colors """
+        self.rows[indices] = colors
+        if self.auto_write:
+            self.show()
+
+    def fill_indices(self, indices, color):
+        """ Sets the pixels in the index array indices to color """
+        self.rows[indices] = rgb(color)
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        pass
+
+    def deinit(self):
+        self.fill(0)
+        self.show()
+
+    def _index(self, index):
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError
+        return index
+
+    def _set(self, index, color):
+        i = 3 * index
+        self.buf[i : i + 3] = bytes(rgb(color))
+
+
+class FrameBuffer(PixelBuffer):
+    """Class for the frame drawn by the animations, in front of a pixel strip
+
+    :param strip: The pixel strip (neopixel.NeoPixel or SimulatedPixels) frames are written to.
+    :param float brightness: Master brightness (Default 1.0).
+    :param float gamma: Gamma applied at output, or None for linear output (Default None).
+
+    shown and suppressed count the show() calls written and skipped.
+    """
+
+    def __init__(self, strip, brightness=1.0, gamma=None):
+        super().__init__(len(strip))
+        self.strip = strip
+        self.shown = 0
+        self.suppressed = 0
+        self._brightness = min(max(brightness, 0.0), 1.0)
+        self._intensity = 1.0
+        self._gamma = gamma
+        self._table = scale_table(self._brightness, gamma)
+        self._last = None
+        self._last_table = None
+        # The scaled frame last written to the strip
+        self._written = None
+        self._fade_from = None
+        self._fade_start = 0.0
+        self._fade_duration = 0.0
+        self._show_receivers = []
+        strip.brightness = 1.0
+
+    @property
+    def brightness(self):
+        """ Master brightness, applied at output """
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self._brightness = min(max(value, 0.0), 1.0)
+        self._set_table()
+
+    @property
+    def intensity(self):
+        """ Intensity of the current mode, applied at output on top of brightness """
+        return self._intensity
+
+    @intensity.setter
+    def intensity(self, value):
+        self._intensity = min(max(value, 0.0), 1.0)
+        self._set_table()
+
+    @property
+    def gamma(self):
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, value):
+        self._gamma = value
+        self._set_table()
+
+    def add_show_receiver(self, callback):
+        """ Adds a callback called with this FrameBuffer each time a frame is written to the strip """
+        self._show_receivers.append(callback)
+
+    @property
+    def fading(self):
+        """ True while a crossfade is in progress """
+        return self._fade_from is not None
+
+    def crossfade(self, duration):
+        """ Fades from the frame last written to the strip to the frames shown over the next duration seconds """
+        if self._written is None or duration <= 0:
+            return
+        self._fade_from = np.frombuffer(self._written, dtype=np.uint8).astype(
+            np.float32
+        )
+        self._fade_start = monotonic()
+        self._fade_duration = duration
+
+    def show(self):
+        if self._fade_from is not None:
+            frame = self._fade()
+        elif self._table is self._last_table and self.buf == self._last:
+            self.suppressed += 1
+            return
+        else:
+            frame = self.buf.translate(self._table)
+        set_frame = getattr(self.strip, "set_frame", None)
+        if set_frame is not None:
+            set_frame(frame)
+        else:
+            self.strip[0 : self.n] = [
+                tuple(frame[i : i + 3]) for i in range(0, len(frame), 3)
+            ]
+        self.strip.show()
+        self._written = frame
+        self._last = bytes(self.buf) if self._fade_from is None else None
+        self._last_table = self._table
+        self.shown += 1
+        for callback in self._show_receivers:
+            callback(self)
+
+    def invalidate(self):
+        """ Forces the next show() to write to the strip """
+        self._last = None
+
+    def deinit(self):
+        self.fill(0)
+        self.show()
+        self.strip.deinit()
+
+    @property
+    def suppressed_ratio(self):
+        total = self.shown + self.suppressed
+        return self.suppressed / total if total else 0.0
+
+    def _set_table(self):
+        self._table = scale_table(self._intensity * self._brightness, self._gamma)
+
+    def _fade(self):
+        """ Returns the scaled frame blended with the one faded from """
+        frame = self.buf.translate(self._table)
+        done = (monotonic() - self._fade_start) / self._fade_duration
+        if done >= 1.0:
+            self._fade_from = None
+            return frame
+        blend = self._fade_from * (1.0 - done)
+        blend += np.frombuffer(frame, dtype=np.uint8) * done
+        return blend.astype(np.uint8).tobytes()
@@ -0,0 +1,157 @@
+""" governor v0.1
+Frame rate governor for the animations
+
+Animations schedule their next frame speed after the frame they just drew, so a
+slow frame pushes every later frame back.  The Governor animates the current
+mode animation and then reschedules each animation that drew:
+
+  * Frames stay on the wall clock schedule - the next frame is due one period
+    after the last one was due, not after it was drawn (and an animation an
+    AnimationSequence switches to is due when the frame that switched it was).  Frames that were missed
+    entirely are skipped (animations with a skip(frames) method, like Baked, are
+    advanced past them), unless the animation is more than max_skip frames
+    behind, e.g. it has just been switched in, when its schedule is restarted.
+  * The period is the animation's speed, raised to 1/fps for animations given a
+    target fps with target(), and to 1/max_fps for all of them.
+  * If the process uses more than cpu_budget of a CPU over a second, every
+    period is stretched by slowdown (up to MAX_SLOWDOWN), which is relaxed again
+    once usage falls under half the budget.
+  * Once idle_frames drawn frames in a row haven't changed the strip (a static
+    scene), the period is doubled with each further unchanged frame, up to
+    idle_max seconds.  Any change, or wake(), restores the normal rate.
+
+skipped, throttled and idled count the frames skipped, the slowdowns and the
+frames drawn at a lowered idle rate.
+"""
+
+from time import process_time
+
+from adafruit_led_animation import MS_PER_SECOND, monotonic_ms
+
+from .timing import leaves
+
+# Longest stretch applied to the frame periods when over the CPU budget
+MAX_SLOWDOWN = 4.0
+# Milliseconds over which CPU usage is measured
+CPU_WINDOW = 1000
+
+
+class Governor(object):
+    """
+    Animates animations on a wall clock schedule within a CPU budget.
+    :param pixels: The FrameBuffer the animations draw to.
+    :param float max_fps: Highest frame rate of any animation (Default 30).
+    :param float cpu_budget: Fraction of a CPU the process should stay under (Default 0.5).
+    :param int max_skip: Most frames skipped to catch up before the schedule is restarted (Default 8).
+    :param int idle_frames: Unchanged frames in a row before the rate is lowered (Default 3).
+    :param float idle_max: Longest period in seconds of a static scene (Default 10.0).
+    """
+
+    def __init__(
+        self,
+        pixels,
+        max_fps=30,
+        cpu_budget=0.5,
+        max_skip=8,
+        idle_frames=3,
+        idle_max=10.0,
+    ):
+        self.pixels = pixels
+        self.cpu_budget = cpu_budget
+        self.max_skip = max_skip
+        self.idle_frames = idle_frames
+        self.slowdown = 1.0
+        self.idle = 1
+        self.cpu = 0.0
+        self.skipped = 0
+        self.throttled = 0
+        self.idled = 0
+        self._min_period = MS_PER_SECOND / max_fps
+        self._idle_max = idle_max * MS_PER_SECOND
+        self._targets = {}
+        self._unchanged = 0
+        self._shown = pixels.shown
+        self._cpu_since = monotonic_ms()
+        self._cpu_last = process_time()
+
+    def target(self, animation, fps):
+        """ Caps animation (or every animation driving it) at fps frames a second """
+        for leaf in leaves(animation):
+            self._targets[leaf] = MS_PER_SECOND / fps
+
+    def animate(self, animation):
+        """
+        Animates animation, and reschedules the animations that drew.
+        :return: True if any animation drew.
+        """
+        drivers = list(leaves(animation))
+        due = [leaf._next_update for leaf in drivers]
+        drew = animation.animate()
+        now = monotonic_ms()
+        if drew:
+            self._track_idle()
+            drawn = now
+            for leaf, leaf_due in zip(drivers, due):
+                if leaf._next_update != leaf_due:
+                    drawn = min(drawn, leaf_due)
+                    leaf._next_update = self._next_due(leaf, leaf_due, now)
+            # Animations a sequence has just switched to are due at once, on the schedule of the frame that switched
+            for leaf in leaves(animation):
+                if leaf not in drivers and leaf._next_update < drawn:
+                    leaf._next_update = drawn
+        if now - self._cpu_since >= CPU_WINDOW:
+            self._check_cpu(now)
+        return drew
+
+    def wake(self, animation):
+        """ Restores the normal rate after a change from outside the animation, and makes its next frame due now """
+        self.idle = 1
+        self._unchanged = 0
+        now = monotonic_ms()
+        for leaf in leaves(animation):
+            if leaf._next_update > now:
+                leaf._next_update = now
+
+    def period(self, leaf):
+        """ Returns the milliseconds between frames of the animation leaf """
+        base = max(leaf._speed_ms, self._targets.get(leaf, 0), self._min_period)
+        base *= self.slowdown
+        if self.idle > 1:
+            return min(base * self.idle, max(base, self._idle_max))
+        return base
+
+    def _next_due(self, leaf, due, now):
+        period = self.period(leaf)
+        late = now - due
+        if late >= period * self.max_skip:
+            return now + period
+        missed = int(late // period)
+        if missed:
+            self.skipped += missed
+            skip = getattr(leaf, "skip", None)
+            if skip is not None:
+                skip(missed)
+        return due + (missed + 1) * period
+
+    def _track_idle(self):
+        changed = self.pixels.shown != self._shown
+        self._shown = self.pixels.shown
+        if changed:
+            self.idle = 1
+            self._unchanged = 0
+            return
+        self._unchanged += 1
+        if self._unchanged >= self.idle_frames:
+            self.idle = min(self.idle * 2, 1 << 16)
+            self.idled += 1
+
+    def _check_cpu(self, now):
+        cpu = process_time()
+        self.cpu = (cpu - self._cpu_last) * MS_PER_SECOND / (now - self._cpu_since)
+        self._cpu_since = now
+        self._cpu_last = cpu
+        if self.cpu > self.cpu_budget and self.slowdown < MAX_SLOWDOWN:
+            self.slowdown = min(self.slowdown * 1.25, MAX_SLOWDOWN)
+            self.throttled += 1
+        elif self.cpu < self.cpu_budget / 2 and self.slowdown > 1.0:
+            self.slowdown = max(self.slowdown / 1.25, 1.0)
@@ -1,12 +1,15 @@
-""" groups v0.2
-Pixel groupings used by the various animations """
+""" groups v0.3
+Pixel groupings used by the various animations
 
-from adafruit_led_animation.helper import PixelSubset, PixelMap
+Groups are IndexGroups, compiled into index tables once at import so writes to a
+group are bulk writes to pixels. """
 
 from . import pixels
+from .compositor import LayerBuffer
+from .indexgroup import IndexGroup
 
 # Setup Pixel Groups
-cross_strips = PixelMap(
+cross_strips = IndexGroup(
     pixels,
     [
         (31, 16, 15, 0),
@@ -25,41 +28,49 @@ cross_strips = PixelMap(
     individual_pixels=True,
 )
 
-hatch_strips = PixelMap(
+hatch_strips = IndexGroup(
     pixels,
     [(24, 32), (16, 24), (8, 16), (0, 8), (44, 48), (40, 44), (36, 40), (32, 36)],
 )
 
-sunny75 = PixelSubset(pixels, 8, 32)
-sunny50 = PixelSubset(pixels, 16, 32)
-sunny25 = PixelSubset(pixels, 24, 32)
-cloudy75 = PixelMap(pixels, [(32, 48), (0, 24)])
-cloudy50 = PixelMap(pixels, [(32, 48), (0, 16)])
-cloudy25 = PixelMap(pixels, [(32, 48), (0, 8)])
-top_half = PixelSubset(pixels, 0, 32)
-rain_pixels = PixelSubset(pixels, 32, 48)
+sunny75 = IndexGroup.subset(pixels, 8, 32)
+sunny50 = IndexGroup.subset(pixels, 16, 32)
+sunny25 = IndexGroup.subset(pixels, 24, 32)
+cloudy75 = IndexGroup(pixels, [(32, 48), (0, 24)])
+cloudy50 = IndexGroup(pixels, [(32, 48), (0, 16)])
+cloudy25 = IndexGroup(pixels, [(32, 48), (0, 8)])
+top_half = IndexGroup.subset(pixels, 0, 32)
+rain_pixels = IndexGroup.subset(pixels, 32, 48)
 
 # Lightning Path Groups
-lightning_path_1 = PixelMap(
+lightning_path_1 = IndexGroup(
     pixels, [26, 28, 30, 19, 11, 2, 46, 42, 38], individual_pixels=True
 )
 
-lightning_path_2 = PixelMap(
+lightning_path_2 = IndexGroup(
     pixels, [41, 45, 4, 13, 20, 25, 27, 33, 39], individual_pixels=True
 )
 
-lightning_path_3 = PixelMap(
+lightning_path_3 = IndexGroup(
     pixels, [39, 31, 29, 18, 11, 7, 45, 41, 32], individual_pixels=True
 )
 
-lightning_path_4 = PixelMap(
+lightning_path_4 = IndexGroup(
     pixels, [6, 10, 20, 29, 17, 39, 38, 42, 47], individual_pixels=True
 )
 
-lightning_path_5 = PixelMap(
+lightning_path_5 = IndexGroup(
     pixels, [44, 38, 31, 17, 13, 3, 9, 38, 34], individual_pixels=True
 )
 
-lightning_path_6 = PixelMap(
+lightning_path_6 = IndexGroup(
     pixels, [7, 10, 11, 12, 18, 30, 32, 37, 41], individual_pixels=True
 )
+
+
+def on_layer(group):
+    """Returns the pixels of group (an IndexGroup of pixels, or pixels) on a new LayerBuffer, for drawing a Scene layer"""
+    layer = LayerBuffer(len(pixels))
+    if group is pixels:
+        return layer
+    return group.on(layer)
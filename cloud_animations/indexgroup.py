@@ -0,0 +1,119 @@
+""" indexgroup v0.1
+Pixel groups compiled into flat index tables
+
+IndexGroup takes the same arguments as adafruit_led_animation's PixelMap, but
+compiles the ranges once into NumPy index arrays so that setting a grouped
+pixel, a slice or the whole group is a single fill_indices()/write_indices()
+call on the strip (a FrameBuffer or LayerBuffer) instead of one __setitem__
+per strip pixel.
+"""
+
+import numpy as np
+
+from .colors import rgb
+
+
+class IndexGroup(object):
+    """
+    Treats ranges (or groups) of strip pixels as single pixels, like PixelMap.
+    :param strip: The PixelBuffer (FrameBuffer or LayerBuffer) to write to.
+    :param iterable pixel_ranges: Pixel ranges (or individual pixels).
+    :param bool individual_pixels: Whether pixel_ranges are individual pixels.
+
+    indices holds every strip pixel of the group in order, and members[i] the
+    strip pixels of grouped pixel i.
+    """
+
+    def __init__(self, strip, pixel_ranges, individual_pixels=False):
+        if not pixel_ranges:
+            raise ValueError("An IndexGroup must have at least one pixel defined")
+        if not individual_pixels:
+            ranges = [list(range(start, end)) for start, end in pixel_ranges]
+        elif isinstance(pixel_ranges[0], int):
+            ranges = [[pixel] for pixel in pixel_ranges]
+        else:
+            ranges = [list(pixels) for pixels in pixel_ranges]
+
+        self.strip = strip
+        self.ranges = ranges
+        self.n = len(ranges)
+        self.members = [np.array(pixels, dtype=np.intp) for pixels in ranges]
+        self.indices = np.concatenate(self.members)
+        self.individual = len(self.indices) == self.n
+        lengths = [len(pixels) for pixels in ranges]
+        self._offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self._owner = np.repeat(np.arange(self.n), lengths)
+        self._first = [pixels[0] for pixels in ranges]
+
+    @classmethod
+    def subset(cls, strip, start, end):
+        """ Returns an IndexGroup of the strip pixels start to end-1, like PixelSubset """
+        return cls(strip, list(range(start, end)), individual_pixels=True)
+
+    def on(self, strip):
+        """ Returns an IndexGroup of the same pixels on another strip """
+        return IndexGroup(strip, self.ranges, individual_pixels=True)
+
+    def __repr__(self):
+        return "[" + ", ".join(str(self[i]) for i in range(self.n)) + "]"
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, val):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.n)
+            if len(val) != len(range(start, stop, step)):
+                raise ValueError("Slice and input sequence size do not match.")
+            if step != 1:
+                for val_i, in_i in enumerate(range(start, stop, step)):
+                    self.strip.fill_indices(self.members[in_i], val[val_i])
+            elif stop > start:
+                first, last = self._offsets[start], self._offsets[stop]
+                colors = np.array([rgb(color) for color in val], dtype=np.uint8)
+                self.strip.write_indices(
+                    self.indices[first:last], colors[self._owner[first:last] - start]
+                )
+        else:
+            self.strip.fill_indices(self.members[index], val)
+        if self.strip.auto_write:
+            self.show()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.strip[self._first[i]] for i in range(*index.indices(self.n))]
+        if index < 0:
+            index += self.n
+        if index >= self.n or index < 0:
+            raise IndexError
+        return self.strip[self._first[index]]
+
+    def write(self, colors):
+        """ Sets every grouped pixel from the matching row of the (n, 3) uint8 array colors """
+        if self.individual:
+            self.strip.write_indices(self.indices, colors)
+        else:
+            self.strip.write_indices(self.indices, colors[self._owner])
+
+    def fill(self, color):
+        """ Fills every pixel of the group with color """
+        self.strip.fill_indices(self.indices, color)
+
+    def show(self):
+        self.strip.show()
+
+    @property
+    def brightness(self):
+        return self.strip.brightness
+
+    @brightness.setter
+    def brightness(self, brightness):
+        self.strip.brightness = min(max(brightness, 0.0), 1.0)
+
+    @property
+    def auto_write(self):
+        return self.strip.auto_write
+
+    @auto_write.setter
+    def auto_write(self, value):
+        self.strip.auto_write = value
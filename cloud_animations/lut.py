@@ -0,0 +1,29 @@
+""" lut v0.1
+Color scaling lookup tables
+
+A table maps every channel value (0-255) to its output value for a given scale
+(intensity x master brightness) and optional gamma.  Tables are 256 byte
+bytes objects, so a whole frame is scaled with a single bytearray.translate().
+"""
+
+from functools import lru_cache
+
+IDENTITY = bytes(range(256))
+
+
+def scale_table(scale, gamma=None):
+    """Returns the 256 byte lookup table scaling channel values by scale (0.0-1.0), gamma corrected if gamma is set"""
+    # Round so tables for intensities reached by repeated 0.1 steps are shared
+    return _scale_table(round(min(max(scale, 0.0), 1.0), 3), gamma)
+
+
+@lru_cache(maxsize=64)
+def _scale_table(scale, gamma):
+    if gamma is None:
+        if scale == 1.0:
+            return IDENTITY
+        # Truncate like neopixel's per-pixel brightness scaling
+        return bytes(int(value * scale) for value in range(256))
+    return bytes(
+        int((value / 255) ** gamma * 255 * scale + 0.5) for value in range(256)
+    )
@@ -0,0 +1,143 @@
+""" particles v0.1
+Fixed-capacity particle pool shared by the particle-style animations
+
+A particle is an active pixel with a start time, a lifetime (period, in ms)
+and a color.  Particles are stored densely in the first count slots of
+preallocated arrays, and the pixels not in use are kept in a free list with a
+position index, so spawning on a random free pixel and retiring a particle are
+both O(1) and allocate nothing once the pool is built.
+"""
+
+import random
+from array import array
+
+
+class ParticlePool(object):
+    """Class for a pool of up to capacity particles on a strip of num_pixels pixels
+
+    Slots 0 .. count-1 of pixel, start, period and color hold the live particles.
+    Retiring a particle moves the last live particle into its slot, so slot
+    numbers are only stable until the next retire().
+
+    Use:
+        pool = ParticlePool(4, len(pixel_object))
+        slot = pool.spawn(now, 1000, 0x0000FF)
+        ...
+        pool.retire(slot)
+    """
+
+    __slots__ = (
+        "capacity",
+        "num_pixels",
+        "count",
+        "pixel",
+        "start",
+        "period",
+        "color",
+        "_free",
+        "_free_count",
+        "_position",
+    )
+
+    def __init__(self, capacity, num_pixels):
+        if capacity > num_pixels:
+            raise ValueError("ParticlePool capacity can't exceed the number of pixels")
+        self.capacity = capacity
+        self.num_pixels = num_pixels
+        self.count = 0
+        self.pixel = array("l", [0] * capacity)
+        self.start = array("q", [0] * capacity)
+        self.period = array("q", [0] * capacity)
+        self.color = array("l", [0] * capacity)
+        # _free[:_free_count] are the unused pixels, _position[p] is p's index in _free
+        self._free = array("l", range(num_pixels))
+        self._free_count = num_pixels
+        self._position = array("l", range(num_pixels))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def free(self):
+        """ Number of pixels without a particle """
+        return self._free_count
+
+    def spawn(self, start=0, period=0, color=0, pixel=None):
+        """
+        Adds a particle on pixel (or a random free pixel) and returns its slot,
+        or -1 if the pool is full or pixel is already in use.
+        """
+        if self.count == self.capacity or self._free_count == 0:
+            return -1
+        if pixel is None:
+            pixel = self._free[random.randrange(self._free_count)]
+        elif self._position[pixel] >= self._free_count:
+            return -1
+        self._claim(pixel)
+
+        slot = self.count
+        self.pixel[slot] = pixel
+        self.start[slot] = start
+        self.period[slot] = period
+        self.color[slot] = color
+        self.count += 1
+        return slot
+
+    def retire(self, slot):
+        """ Removes the particle in slot, freeing its pixel, and returns the pixel """
+        pixel = self.pixel[slot]
+        self._release(pixel)
+
+        last = self.count - 1
+        if slot != last:
+            self.pixel[slot] = self.pixel[last]
+            self.start[slot] = self.start[last]
+            self.period[slot] = self.period[last]
+            self.color[slot] = self.color[last]
+        self.count = last
+        return pixel
+
+    def expired(self, now):
+        """ Returns the slot of a particle whose period has passed at time now, or -1 """
+        start = self.start
+        period = self.period
+        for slot in range(self.count):
+            if now - start[slot] > period[slot]:
+                return slot
+        return -1
+
+    def clear(self):
+        """ Retires every particle """
+        while self.count:
+            self.retire(self.count - 1)
+
+    def reset(self):
+        """ Retires every particle and puts the free list back in pixel order, so the pixels
+        picked from then on only depend on the state of random """
+        self.count = 0
+        self._free_count = self.num_pixels
+        for pixel in range(self.num_pixels):
+            self._free[pixel] = pixel
+            self._position[pixel] = pixel
+
+    def _claim(self, pixel):
+        # Swap pixel with the last free pixel and shrink the free list
+        index = self._position[pixel]
+        last = self._free_count - 1
+        other = self._free[last]
+        self._free[index] = other
+        self._position[other] = index
+        self._free[last] = pixel
+        self._position[pixel] = last
+        self._free_count = last
+
+    def _release(self, pixel):
+        # Swap pixel with the first used pixel and grow the free list
+        index = self._position[pixel]
+        first = self._free_count
+        other = self._free[first]
+        self._free[index] = other
+        self._position[other] = index
+        self._free[first] = pixel
+        self._position[pixel] = first
+        self._free_count = first + 1
@@ -19,7 +19,7 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
-""" randcolorcycle v0.2
+""" randcolorcycle v0.3
 Modified from:  `adafruit_led_animation.animation.colorcycle`
 Modified by: Alex P
 
@@ -45,6 +45,8 @@ import random
 from adafruit_led_animation.animation import Animation
 from adafruit_led_animation.color import RAINBOW
 
+from .particles import ParticlePool
+
 
 class RandColorCycle(Animation):
     """
@@ -71,7 +73,7 @@ class RandColorCycle(Animation):
         super().__init__(pixel_object, upper_speed, colors[0], name=name)
         self._generator = self._color_generator()
         next(self._generator)
-        self._pixels = []
+        self._pool = ParticlePool(num_pixels, len(pixel_object))
         self.lower_speed = lower_speed
         self.upper_speed = upper_speed
         self._num_pixels = num_pixels
@@ -81,8 +83,9 @@ class RandColorCycle(Animation):
     on_cycle_complete_supported = True
 
     def draw(self):
-        for pixel in self._pixels:
-            self.pixel_object[pixel] = self.color
+        pixel = self._pool.pixel
+        for slot in range(self._pool.count):
+            self.pixel_object[pixel[slot]] = self.color
         next(self._generator)
         self.speed = round(random.uniform(self.lower_speed, self.upper_speed), 2)
 
@@ -96,14 +99,15 @@ class RandColorCycle(Animation):
                 self.cycle_complete = True
 
     def _get_pixels(self, animation):
-        self._pixels = [
-            random.randint(0, (len(self.pixel_object) - 1))
-            for _ in range(self._num_pixels)
-        ]
+        self._pool.clear()
+        for _ in range(self._num_pixels):
+            self._pool.spawn()
         animation.notify_cycles = random.randint(1, 5)
 
     def reset(self):
         """
-        Resets to the first color.
+        Resets to the first color, on newly picked pixels.
         """
         self._generator = self._color_generator()
+        self._pool.reset()
+        self._get_pixels(self)
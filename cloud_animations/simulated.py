@@ -0,0 +1,40 @@
+""" simulated v0.1
+In-memory stand-ins for the lamp hardware
+
+Selected with the CLOUDLAMP_BACKEND=sim environment variable so that
+cloud_animations (and code_main) can run on a machine without NeoPixels.
+"""
+
+from collections import deque
+from time import monotonic
+
+from .framebuffer import PixelBuffer
+from .lut import scale_table
+
+
+class SimulatedPixels(PixelBuffer):
+    """Class for an in-memory pixel strip with the neopixel.NeoPixel API
+
+    Every show() records the brightness adjusted frame (as RGB bytes) in frames
+    and the time it was shown in show_times.
+    """
+
+    def __init__(self, n, brightness=1.0, auto_write=True, history=1000):
+        super().__init__(n)
+        self.auto_write = auto_write
+        self.brightness = min(max(brightness, 0.0), 1.0)
+        self.frames = deque(maxlen=history)
+        self.show_times = deque(maxlen=history)
+        self.show_count = 0
+
+    def show(self):
+        self.frames.append(self.buf.translate(scale_table(self.brightness)))
+        self.show_times.append(monotonic())
+        self.show_count += 1
+
+
+class SimulatedGPIO(object):
+    """ Stand-in for board.pin.GPIO """
+
+    def cleanup(self):
+        pass
@@ -0,0 +1,96 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Kattni Rembor for Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+""" sparkle v0.1
+Modified from: `adafruit_led_animation.animation.sparkle`
+Modified by: Alex P
+
+Sparkles are particles in a ParticlePool, so each frame picks distinct pixels
+without allocating.  As in the library, a sparkle is shown at full color for one
+frame, then left at a quarter of it with the pixel after it at a tenth; that
+dimming is done at the start of the next draw() instead of after an extra show()
+from after_draw(), which writes the same frames to the strip.
+================================================================================
+Sparkle animation for CircuitPython helper library for LED animations.
+* Author(s): Kattni Rembor
+Implementation Notes
+--------------------
+**Hardware:**
+* `Adafruit NeoPixels <https://www.adafruit.com/category/168>`_
+* `Adafruit DotStars <https://www.adafruit.com/category/885>`_
+**Software and Dependencies:**
+* Adafruit CircuitPython firmware for the supported boards:
+  https://circuitpython.org/downloads
+"""
+
+from adafruit_led_animation.animation import Animation
+
+from .particles import ParticlePool
+
+
+class Sparkle(Animation):
+    """
+    Sparkle animation of a single color.
+    :param pixel_object: The initialised LED object.
+    :param float speed: Animation speed in seconds, e.g. ``0.1``.
+    :param color: Animation color in ``(r, g, b)`` tuple, or ``0x000000`` hex format.
+    :param num_sparkles: Number of sparkles to generate per animation cycle.
+    """
+
+    def __init__(self, pixel_object, speed, color, num_sparkles=1, name=None):
+        if len(pixel_object) < 2:
+            raise ValueError("Sparkle needs at least 2 pixels")
+        self._half_color = color
+        self._dim_color = color
+        self._sparkle_color = color
+        self._num_sparkles = num_sparkles
+        self._pool = ParticlePool(num_sparkles, len(pixel_object))
+        super().__init__(pixel_object, speed, color, name=name)
+
+    def _set_color(self, color):
+        half_color = tuple(color[rgb] // 4 for rgb in range(len(color)))
+        dim_color = tuple(color[rgb] // 10 for rgb in range(len(color)))
+        for pixel in range(len(self.pixel_object)):
+            if self.pixel_object[pixel] == self._half_color:
+                self.pixel_object[pixel] = half_color
+            elif self.pixel_object[pixel] == self._dim_color:
+                self.pixel_object[pixel] = dim_color
+        self._half_color = half_color
+        self._dim_color = dim_color
+        self._sparkle_color = color
+
+    def draw(self):
+        pool = self._pool
+        num_pixels = len(self.pixel_object)
+        # Last frame's sparkles fade to a quarter, and the pixels after them to a tenth
+        for i in range(pool.count):
+            pixel = pool.pixel[i]
+            self.pixel_object[pixel] = self._half_color
+            self.pixel_object[(pixel + 1) % num_pixels] = self._dim_color
+        pool.clear()
+        for _ in range(self._num_sparkles):
+            self.pixel_object[pool.pixel[pool.spawn()]] = self._sparkle_color
+
+    def reset(self):
+        """
+        Removes all sparkles.
+        """
+        self._pool.clear()
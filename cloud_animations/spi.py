@@ -0,0 +1,131 @@
+""" spi v0.1
+WS2812 output over SPI
+
+Drives the NeoPixels from the SPI MOSI pin (GPIO 10) instead of PWM/DMA on D18,
+so the lamp doesn't have to run as root - the user only needs access to
+/dev/spidev0.0 (the spi group on Raspberry Pi OS).
+
+At SPI_HZ (2.4 MHz) each WS2812 bit is sent as 3 SPI bits, 110 for a 1 and 100
+for a 0, so every color byte becomes 3 SPI bytes.  ENCODING holds those 3 bytes
+for all 256 byte values, so a frame is encoded with one table lookup per color
+byte (a single NumPy take over the whole frame) instead of bit by bit, and sent
+with a single write() followed by enough low bytes to latch the strip.
+
+The device may be the path of a spidev device or any file object, e.g. an open
+file or pipe standing in for the device when testing on a machine without SPI.
+"""
+
+import fcntl
+import struct
+
+import numpy as np
+
+from mylog import get_logger
+
+from .framebuffer import PixelBuffer
+from .lut import IDENTITY, scale_table
+
+logger = get_logger(__name__)
+
+SPI_HZ = 2400000
+# Low bytes after a frame - 300 us, enough for the WS2812B reset/latch
+RESET_BYTES = 90
+# linux/spi/spidev.h
+SPI_IOC_WR_MODE = 0x40016B01
+SPI_IOC_WR_MAX_SPEED_HZ = 0x40046B04
+
+
+def encode_bits(data):
+    """Returns the SPI bytes for the color bytes data, encoded bit by bit."""
+    out = bytearray()
+    for byte in data:
+        bits = 0
+        for i in range(7, -1, -1):
+            bits = bits << 3 | (0b110 if byte >> i & 1 else 0b100)
+        out += bits.to_bytes(3, "big")
+    return bytes(out)
+
+
+# The 3 SPI bytes of every color byte value, as a (256, 3) array
+ENCODING = np.frombuffer(encode_bits(range(256)), dtype=np.uint8).reshape(256, 3)
+
+
+def encode(data, out=None):
+    """Returns the SPI bytes for the color bytes data, using ENCODING.  If out is given
+    (a writable buffer of 3 bytes per color byte) the result is written into it instead."""
+    values = np.frombuffer(data, dtype=np.uint8)
+    if out is None:
+        return ENCODING[values].tobytes()
+    np.take(
+        ENCODING, values, axis=0, out=np.frombuffer(out, dtype=np.uint8).reshape(-1, 3)
+    )
+    return out
+
+
+class SPIPixels(PixelBuffer):
+    """Class for a WS2812 strip on SPI with the neopixel.NeoPixel API
+
+    :param int n: Number of pixels.
+    :param device: Path of the spidev device, or a file object to write frames to
+                   (Default "/dev/spidev0.0").
+    :param str pixel_order: Order the strip expects the colors in (Default "GRB").
+    :param int speed_hz: SPI clock, which must be close to SPI_HZ (Default SPI_HZ).
+    :param float brightness: Brightness applied on show() (Default 1.0).
+    :param bool auto_write: Whether every change is shown at once (Default True).
+    """
+
+    def __init__(
+        self,
+        n,
+        device="/dev/spidev0.0",
+        pixel_order="GRB",
+        speed_hz=SPI_HZ,
+        brightness=1.0,
+        auto_write=True,
+    ):
+        super().__init__(n)
+        self._order = ["RGB".index(channel) for channel in pixel_order]
+        self._owns_device = isinstance(device, str)
+        if self._owns_device:
+            device = open(device, "wb", buffering=0)
+            _configure(device, speed_hz)
+        self._device = device
+        # Leading low byte, the encoded frame and the latch, sent in one write
+        self._out = bytearray(1 + 9 * n + RESET_BYTES)
+        self._encoded = memoryview(self._out)[1 : 1 + 9 * n]
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self.writes = 0
+
+    @property
+    def brightness(self):
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self._brightness = min(max(value, 0.0), 1.0)
+        self._table = scale_table(self._brightness)
+
+    def show(self):
+        colors = self.rows[:, self._order].tobytes()
+        if self._table is not IDENTITY:
+            colors = colors.translate(self._table)
+        encode(colors, self._encoded)
+        self._device.write(self._out)
+        self.writes += 1
+
+    def deinit(self):
+        self.fill(0)
+        self.show()
+        if self._owns_device:
+            self._device.close()
+
+
+def _configure(device, speed_hz):
+    """Sets SPI mode 0 and the clock speed of the spidev device"""
+    try:
+        fcntl.ioctl(device, SPI_IOC_WR_MODE, struct.pack("B", 0))
+        fcntl.ioctl(device, SPI_IOC_WR_MAX_SPEED_HZ, struct.pack("I", speed_hz))
+    except OSError as e:
+        # Not a spidev device, e.g. a file or pipe standing in for one
+        logger.warning(f"Could not configure SPI on {device.name}: {e}")
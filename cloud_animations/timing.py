@@ -0,0 +1,41 @@
+""" timing v0.1
+Helpers for working out when animations next need to be drawn
+"""
+
+from adafruit_led_animation import MS_PER_SECOND, monotonic_ms
+
+
+def leaves(animation):
+    """Yields the Animations that drive the frame timing of animation
+
+    Descends into AnimationGroup members (only the first member of a synced
+    group, as it draws its peers) and the current AnimationSequence member.
+    """
+    members = getattr(animation, "_members", None)
+    if members is None:
+        yield animation
+    elif hasattr(animation, "current_animation"):
+        yield from leaves(animation.current_animation)
+    elif getattr(animation, "_sync", False):
+        yield from leaves(members[0])
+    else:
+        for member in members:
+            yield from leaves(member)
+
+
+def next_frame_in(animation, now=None):
+    """Returns the number of seconds until animation has a frame due
+
+    Returns 0 if a frame is already due, or None if every animation is paused.
+    """
+    if now is None:
+        now = monotonic_ms()
+    due = None
+    for anim in leaves(animation):
+        if anim._paused:
+            continue
+        if due is None or anim._next_update < due:
+            due = anim._next_update
+    if due is None:
+        return None
+    return max(0, due - now) / MS_PER_SECOND
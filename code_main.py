@@ -10,11 +10,12 @@ TODO:
 """
 
 # Standard library imports
-import board
-from random import randint
+import os
+import selectors
 import sys
 import signal
-from time import monotonic, sleep
+from random import getrandbits
+from time import monotonic, time
 
 # Application library imports
 from mylog import get_logger
@@ -22,73 +23,444 @@ import remote.remote as remote
 import weather.weather as weather
 from remote.adafruit_remote_mapping import mapping
 from secrets import secrets
+from scheduler import Scheduler
+import metrics
+import profiler
+import sync
+from renderer import Renderer, RenderProcess
 import cloud_animations.colorhandler as colorhandler
-from cloud_animations import pixels
-from cloud_animations.animations import (
-    wth_list,
-    mode,
-    reset_strip,
-    weather_anim,
-)
-from cloud_animations.lightning_animations import lightning_list
+from adafruit_led_animation.animation import Animation
+from cloud_animations import pixels, GPIO, backend
+from cloud_animations.framebuffer import PixelBuffer
+from cloud_animations.governor import Governor
+from cloud_animations.animations import wth_list, mode
 
 # Create and setup logger
 logger = get_logger(__name__)
 
+# Seconds to wait for a key press to change the strip before leaving it out of the latency histograms
+LATENCY_TIMEOUT = 5.0
+
+# Seconds between render fps samples
+FPS_INTERVAL = 5.0
+
 # Setup Weather class
 logger.info("Initiating Weather . . .")
-try:
-    myWeather = weather.Weather(appid=secrets["ow_appid"])
-except KeyError:
+weather_cache = secrets.get(
+    "weather_cache",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather_cache.json"),
+)
+weather_opts = {"cache_file": weather_cache}
+if secrets.get("ow_forecast", False):
+    # Fetch the 48 hour forecast every 3 hours and step through it locally
+    weather_opts.update(forecast=True, interval=10800)
+if "ow_broker" in secrets:
+    # Share one WeatherBroker's API requests with the other lamps
+    myWeather = weather.Weather(broker=secrets["ow_broker"], **weather_opts)
+elif "ow_appid" in secrets:
+    myWeather = weather.Weather(appid=secrets["ow_appid"], **weather_opts)
+else:
     logger.warning("ow_appid not set in secrets file - No API Key specified")
-    myWeather = weather.Weather()
+    myWeather = weather.Weather(**weather_opts)
+myWorker = weather.WeatherWorker(myWeather)
 
 # Setup IR remote
 logger.info("Initiating IRRemote . . .")
-myRemote = remote.IRRemote(mapping)
+if backend == "sim":
+    from remote.simulated import SimulatedInputDevice
+
+    myRemote = remote.IRRemote(mapping, SimulatedInputDevice())
+else:
+    myRemote = remote.IRRemote(mapping)
+myReader = remote.RemoteReader(myRemote)
 
 # Setup ColorHandler
 logger.info("Initiating ColorHandler . . .")
 myColor = colorhandler.ColorHandler()
+if "gamma" in secrets:
+    # Gamma correction applied by the output lookup table
+    pixels.gamma = float(secrets["gamma"])
+
+# Setup governor - keeps frames on schedule within the CPU budget, and slows down static scenes
+myGovernor = Governor(
+    pixels,
+    max_fps=float(secrets.get("max_fps", 30)),
+    cpu_budget=float(secrets.get("cpu_budget", 0.5)),
+)
+
+# Setup metrics - the counters kept by the lamp's objects are read when scraped
+metrics.describe("frames_rendered", "Frames drawn by the renderer.")
+metrics.describe("frames_written", "Frames written to the strip.")
+metrics.describe("frames_skipped", "Unchanged frames not written to the strip.")
+metrics.describe("render_fps", "Frames drawn per second.")
+metrics.describe("frame_time", "Time spent drawing a frame.")
+metrics.describe("input_latency", "Key press to frame written.", label="action")
+metrics.describe("weather_fetch", "Time spent fetching the weather.")
+metrics.describe("weather_fetches", "Weather fetches by outcome.", label="outcome")
+metrics.describe("weather_api_calls", "Requests made to the weather api.")
+metrics.describe("weather_api_calls_today", "Requests made to the weather api today.")
+metrics.describe("remote_presses", "Key presses applied.")
+metrics.describe("remote_dropped", "Key presses dropped by a full queue.")
+metrics.describe("mode", "Current mode index.")
+metrics.describe("governor_skipped", "Frames skipped to keep to the wall clock.")
+metrics.describe("governor_throttled", "Slowdowns for going over the CPU budget.")
+metrics.describe("governor_idled", "Frames drawn at a lowered rate for a static scene.")
+metrics.describe("governor_slowdown", "Current stretch of the frame periods.")
+metrics.describe("governor_cpu", "CPU used by the process over the last second.")
+metrics.counter("frames_rendered", lambda: myRenderer.stats()["drawn"])
+metrics.counter("frames_written", lambda: myRenderer.stats()["written"])
+metrics.counter("frames_skipped", lambda: myRenderer.stats()["suppressed"])
+metrics.counter("weather_api_calls", lambda: myWeather.api_calls)
+metrics.gauge("weather_api_calls_today", lambda: myWeather.api_calls_today)
+metrics.counter("remote_dropped", lambda: myReader.dropped)
+metrics.counter("governor_skipped", lambda: myRenderer.stats()["skipped"])
+metrics.counter("governor_throttled", lambda: myRenderer.stats()["throttled"])
+metrics.counter("governor_idled", lambda: myRenderer.stats()["idled"])
+metrics.gauge("governor_slowdown", lambda: myRenderer.stats()["slowdown"])
+metrics.gauge("governor_cpu", lambda: round(myRenderer.stats()["cpu"], 3))
+if "metrics_port" in secrets:
+    myMetrics = metrics.MetricsServer(int(secrets["metrics_port"]))
+elif "metrics_socket" in secrets:
+    myMetrics = metrics.MetricsServer(secrets["metrics_socket"])
+else:
+    myMetrics = None
+
+# Setup profiler - SIGUSR1 profiles the main loop stages, animations and output for a window
+myProfiler = profiler.Profiler(
+    window=float(secrets.get("profile_window", 10.0)),
+    sample_hz=float(secrets.get("profile_sample_hz", 0)),
+    directory=secrets.get("profile_dir"),
+    targets=[
+        (Animation, ("animate", "draw")),
+        (PixelBuffer, ("show",)),
+        (type(pixels.strip), ("show",)),
+    ],
+)
+
+# Setup sync - with secrets["sync"] set to "leader" or "follower", lamps on the LAN show the same scene in step
+mySync = None
+if secrets.get("sync") in ("leader", "follower"):
+    logger.info(f"Initiating sync as {secrets['sync']} . . .")
+    sync_address = dict(
+        group=secrets.get("sync_group", sync.GROUP),
+        port=int(secrets.get("sync_port", sync.PORT)),
+        interface=secrets.get("sync_interface", "0.0.0.0"),
+    )
+    if secrets["sync"] == "leader":
+        mySync = sync.SyncLeader(
+            interval=float(secrets.get("sync_interval", 0.5)), **sync_address
+        )
+        metrics.describe("sync_packets_sent", "Sync packets sent to the followers.")
+        metrics.counter("sync_packets_sent", lambda: mySync.sent)
+    else:
+        mySync = sync.SyncFollower(**sync_address)
+        metrics.describe("sync_packets_received", "Sync packets received.")
+        metrics.describe(
+            "sync_packets_lost", "Sync packets from the leader never received."
+        )
+        metrics.describe("sync_offset", "Leader clock offset in seconds.")
+        metrics.describe("sync_jitter", "Median sync packet delay over the smallest.")
+        metrics.describe("sync_resyncs", "Resyncs after lightning fell out of step.")
+        metrics.counter("sync_packets_received", lambda: mySync.received)
+        metrics.counter("sync_packets_lost", lambda: mySync.lost)
+        metrics.gauge("sync_offset", lambda: mySync.offset or 0.0)
+        metrics.gauge("sync_jitter", lambda: mySync.jitter)
+
+# Renderer (or RenderProcess, with secrets["renderer"] = "process") - created by main()
+myRenderer = None
 
 
 def main():
+    global myRenderer
     # Some basic initializing
     is_enabled = True
-    reset_strip.animate()
     curr_mode = 0
-    next_update = monotonic()
-    mode[0][0] = weather_anim[str(myWeather.id)]
-
-    logger.info("Main loop started.")
-    try:
-        while True:
-            while not myRemote.received():
-                if not is_enabled:
-                    sleep(1)
-                    continue
-
-                weather_check(curr_mode, myWeather, mode, weather_anim)
-
-                next_update = cycle_lightning(
-                    curr_mode, myWeather.id, mode, lightning_list, next_update
-                )
-
-                mode[curr_mode][0].animate()
+    pattern = 0
+    # Colors set from the remote, by mode
+    mode_colors = [None] * len(mode)
+    out_of_step = 0
+    synced = [None]
+    render_fps = metrics.gauge("render_fps")
+    remote_presses = metrics.counter("remote_presses")
+    mode_index = metrics.gauge("mode")
+    fps_sample = [monotonic(), 0]
+
+    # The render process is forked, so it has to be started before any thread is
+    scheduler = Scheduler()
+    if secrets.get("renderer") == "process":
+        myRenderer = RenderProcess(
+            myWeather.id,
+            myGovernor,
+            myProfiler,
+            cpu=secrets.get("render_cpu"),
+            priority=secrets.get("render_priority"),
+        )
+    else:
+        myRenderer = Renderer(scheduler, myWeather.id, myGovernor, myProfiler)
+
+    # Scheduled jobs - all periodic work is owned by the scheduler
+    def poll_weather():
+        if myWeather.due():
+            myWorker.request()
+            return
+        scheduler.reschedule(weather_timer, myWeather.next_update - monotonic())
+
+    def weather_ready():
+        if weather_check(myWeather, myWorker) and not following():
+            myRenderer.set_weather(myWeather.id)
+            myRenderer.refresh()
+            start_epoch()
+        if myWeather.configured:
+            scheduler.reschedule(weather_timer, myWeather.next_update - monotonic())
+        schedule_boundary()
+
+    def forecast_boundary():
+        if weather_advance(myWeather) and not following():
+            myRenderer.set_weather(myWeather.id)
+            myRenderer.refresh()
+            start_epoch()
+        schedule_boundary()
+
+    def schedule_boundary():
+        boundary = myWeather.next_boundary
+        if boundary is None:
+            scheduler.cancel(boundary_timer)
+        else:
+            scheduler.reschedule(boundary_timer, boundary - monotonic())
+
+    def auto_off():
+        nonlocal is_enabled
+        if is_enabled:
+            logger.info("Auto-off time reached.")
+            is_enabled = process_startstop(is_enabled)
+            myRenderer.set_enabled(is_enabled)
+            myRenderer.refresh()
+            start_epoch()
+
+    def log_stats():
+        stats = myRenderer.stats()
+        logger.debug(
+            f"Scheduler: {scheduler.fired_per_second:.2f} timers/s, {len(scheduler)} pending"
+        )
+        logger.debug(
+            f"Frames: {stats['drawn']:.0f} drawn, {stats['written']:.0f} written, {stats['suppressed']:.0f} suppressed"
+        )
+        logger.debug(
+            f"Remote: {myRemote.decodes} keys decoded ({myRemote.unmapped} unmapped), {myRemote.average_decode_time * 1e6:.1f} us average"
+        )
+        logger.debug(
+            f"Governor: {stats['cpu']:.0%} CPU, slowdown x{stats['slowdown']:.2f}, {stats['skipped']:.0f} frames skipped, {stats['idled']:.0f} idle frames"
+        )
+        if myReader.last_latency is not None:
+            logger.debug(
+                f"RemoteReader: {myReader.presses} presses ({myReader.dropped} dropped), last latency {myReader.last_latency * 1000:.1f} ms"
+            )
+        if isinstance(mySync, sync.SyncLeader):
+            logger.debug(f"Sync: {mySync.sent} packets sent ({mySync.failed} failed)")
+        elif following():
+            logger.debug(
+                f"Sync: {mySync.received} packets received ({mySync.lost} lost), offset {mySync.offset * 1000:.3f} ms, jitter {mySync.jitter * 1000:.3f} ms"
+            )
+        elif mySync is not None:
+            logger.debug("Sync: leader not heard from")
+
+    def sample_fps():
+        now = monotonic()
+        drawn = myRenderer.stats()["drawn"]
+        render_fps.set(round((drawn - fps_sample[1]) / (now - fps_sample[0]), 2))
+        fps_sample[:] = [now, drawn]
+
+    # Lamp sync - the leader starts a new epoch of the scene on every change, and followers apply it
+    def following():
+        return isinstance(mySync, sync.SyncFollower) and mySync.following
+
+    def scene_state(epoch, seed):
+        return sync.State(
+            epoch,
+            seed,
+            int(myRenderer.stats()["lightning"]),
+            curr_mode,
+            is_enabled,
+            pattern,
+            myWeather.id,
+            mode_colors[curr_mode],
+            myColor.current_intensity,
+        )
 
-            logger.debug(f"myRemote.received() returned True.  Key: {myRemote.pressed}")
-            pressed = myRemote.pressed
-            curr_mode = process_mode_change(curr_mode, pressed, mode)
-            process_color_change(curr_mode, pressed, mode)
-            process_intensity_change(curr_mode, pressed, mode)
+    def start_epoch():
+        """Starts a new epoch if the scene has changed (otherwise just sends the intensity)."""
+        if not isinstance(mySync, sync.SyncLeader):
+            return
+        if mySync.state is not None:
+            state = scene_state(mySync.state.epoch, mySync.state.seed)
+            if state._replace(intensity=0, lightning=0) == mySync.state._replace(
+                intensity=0, lightning=0
+            ):
+                mySync.update(state)
+                return
+        epoch = monotonic()
+        seed = getrandbits(32)
+        myRenderer.sync(epoch, seed)
+        mySync.update(scene_state(epoch, seed)._replace(lightning=0))
+
+    def repeat_state():
+        if mySync.state is not None:
+            mySync.update(scene_state(mySync.state.epoch, mySync.state.seed))
+
+    def follow(state):
+        """Applies the scene sent by the leader, and syncs the renderer to its epoch."""
+        nonlocal curr_mode, is_enabled, pattern
+        if (state.epoch, state.seed) != synced[0]:
+            synced[0] = (state.epoch, state.seed)
+            if state.mode != curr_mode:
+                curr_mode = state.mode
+                myRenderer.set_mode(curr_mode)
+                mode_index.set(curr_mode)
+            if state.pattern != pattern:
+                pattern = state.pattern
+                myRenderer.set_pattern(pattern)
+            if state.enabled != is_enabled:
+                is_enabled = state.enabled
+                myRenderer.set_enabled(is_enabled)
+            # 0 while the leader doesn't know the condition - keep the one we have
+            if state.weather_id:
+                myRenderer.set_weather(state.weather_id)
+            if state.color is not None and mode[curr_mode][1] == "y":
+                mode_colors[curr_mode] = state.color
+                myRenderer.set_color(state.color)
+            myRenderer.refresh()
+            myRenderer.sync(mySync.to_local(state.epoch), state.seed)
+        # After the mode, as whether intensity applies depends on it
+        myRenderer.set_intensity(state.intensity)
+
+    def sync_ready():
+        nonlocal out_of_step
+        state = mySync.receive()
+        if state is not None:
+            logger.debug(f"Following scene: {state}")
+            follow(state)
+            out_of_step = 0
+            return
+        if mySync.state is None:
+            return
+        # Lightning is picked on the same schedule as the leader's - resync if it is out of step twice running
+        if int(myRenderer.stats()["lightning"]) == mySync.state.lightning:
+            out_of_step = 0
+            return
+        out_of_step += 1
+        if out_of_step >= 2:
+            logger.info("Lightning out of step with the leader - resyncing")
+            metrics.counter("sync_resyncs").inc()
+            myRenderer.sync(mySync.to_local(mySync.state.epoch), mySync.state.seed)
+            out_of_step = 0
+
+    weather_timer = scheduler.call_later(0, poll_weather)
+    boundary_timer = scheduler.call_later(0, forecast_boundary)
+    scheduler.call_every(60, log_stats)
+    scheduler.call_every(FPS_INTERVAL, sample_fps)
+    if not myWeather.configured:
+        scheduler.cancel(weather_timer)
+    if "auto_off" in secrets:
+        hour, minute = (int(n) for n in secrets["auto_off"].split(":"))
+        logger.info(f"Auto-off scheduled daily at {hour:02d}:{minute:02d}")
+        scheduler.call_daily(hour, minute, auto_off)
+    if isinstance(mySync, sync.SyncLeader):
+        scheduler.call_every(mySync.interval, repeat_state)
+    myRenderer.refresh()
+    start_epoch()
+
+    @myProfiler.staged("input")
+    def keys_ready():
+        """Applies every key press queued since the last batch, with runs of the same key coalesced."""
+        nonlocal curr_mode, is_enabled, pattern
+        # Stop waiting on presses that never changed the strip
+        stale = time() - LATENCY_TIMEOUT
+        if awaiting_show and awaiting_show[0][1] < stale:
+            awaiting_show[:] = [entry for entry in awaiting_show if entry[1] >= stale]
+            logger.debug("Dropped key presses that did not change the strip")
+        changed = False
+        for pressed, count, timestamp in remote.coalesce(myReader.completed()):
+            logger.debug(f"Key pressed: {pressed} x{count}")
+            remote_presses.inc(count)
+            awaiting_show.append((key_action(curr_mode, pressed), timestamp))
+            new_mode = process_mode_change(curr_mode, pressed, mode, count)
+            if new_mode != curr_mode:
+                curr_mode = new_mode
+                myRenderer.set_mode(curr_mode)
+                mode_index.set(curr_mode)
+                changed = True
+            if process_color_change(curr_mode, pressed, mode, myRenderer, count):
+                mode_colors[curr_mode] = myColor.color
+                changed = True
+            process_intensity_change(curr_mode, pressed, mode, count)
 
             if curr_mode == 9:
-                process_pattern_change(curr_mode, pressed, mode, wth_list)
+                new_pattern = process_pattern_change(
+                    curr_mode, pressed, pattern, wth_list, count
+                )
+                if new_pattern != pattern:
+                    pattern = new_pattern
+                    myRenderer.set_pattern(pattern)
+                    changed = True
 
-            if pressed == "Play":
+            if pressed == "Play" and count % 2:
                 is_enabled = process_startstop(is_enabled)
+                myRenderer.set_enabled(is_enabled)
+                changed = True
+
+        # Intensity is applied at output, so it doesn't need a frame (or to disturb the frame schedule)
+        myRenderer.set_intensity(myColor.current_intensity)
+        if changed:
+            myRenderer.refresh()
+        start_epoch()
+
+    # Input to photon latency - from the kernel timestamp of each key press to the
+    # first frame written to the strip after its batch was applied
+    awaiting_show = []
+
+    def frame_written(now):
+        if not awaiting_show:
+            return
+        for action, timestamp in awaiting_show:
+            latency = now - timestamp
+            metrics.histogram("input_latency").observe(latency)
+            metrics.histogram(f"input_latency.{action}").observe(latency)
+        awaiting_show.clear()
+
+    myRenderer.add_show_receiver(frame_written)
+
+    # Sleep on the remote reader, weather worker (and render process) until one is ready or a job is due
+    selector = selectors.DefaultSelector()
+    selector.register(myReader, selectors.EVENT_READ)
+    selector.register(myWorker, selectors.EVENT_READ)
+    if isinstance(myRenderer, RenderProcess):
+        selector.register(myRenderer, selectors.EVENT_READ)
+    if isinstance(mySync, sync.SyncFollower):
+        selector.register(mySync, selectors.EVENT_READ)
+    myReader.start()
+    myWorker.start()
+    if myMetrics is not None:
+        myMetrics.start()
+
+    logger.info("Main loop started.")
+    try:
+        while True:
+            for key, _ in selector.select(scheduler.next_due()):
+                if key.fileobj is myWorker:
+                    weather_ready()
+                elif key.fileobj is myRenderer:
+                    myRenderer.receive()
+                    if not myRenderer.alive:
+                        sys.exit(1)
+                elif key.fileobj is mySync:
+                    sync_ready()
+                else:
+                    keys_ready()
+
+            scheduler.run_due()
 
     finally:
+        selector.close()
         cleanup_on_exit()
 
 
@@ -98,95 +470,117 @@ def sigterm_handler(_signo, _stack_frame):
     sys.exit(0)
 
 
+def sigusr1_handler(_signo, _stack_frame):
+    myProfiler.toggle()
+    if isinstance(myRenderer, RenderProcess):
+        myRenderer.toggle_profiler()
+
+
+def sigusr2_handler(_signo, _stack_frame):
+    logger.info(f"Histograms:\n{metrics.dump()}")
+    if isinstance(myRenderer, RenderProcess):
+        myRenderer.log_metrics()
+
+
 def cleanup_on_exit():
-    pixels.fill(0)
-    pixels.show()
+    myProfiler.stop()
+    if myRenderer is not None:
+        myRenderer.close()
+    if mySync is not None:
+        mySync.close()
+    myReader.close()
     myRemote.close()
-    board.pin.GPIO.cleanup()
+    myWorker.close()
+    myWeather.close()
+    if myMetrics is not None:
+        myMetrics.close()
+    GPIO.cleanup()
     logger.info("Exiting raspi-cloudlamp.")
 
 
-def weather_check(c_mode, wth_cls, mode_list, anim_list, force_update=False):
-    """If c_mode is 0 (weather mode), check to see if weather has changed.  If so, update mode_list with matching weather animation from anim_list."""
-    if c_mode != 0:
-        return
-    if wth_cls.update(force_update):
+@myProfiler.staged("weather")
+def weather_check(wth_cls, worker):
+    """Apply the fetches completed by worker to wth_cls, and return True if the weather has changed."""
+    changed = False
+    for resp in worker.completed():
+        changed = wth_cls.apply(resp) or changed
+    if changed:
         logger.debug(f"Changing whether animation: {wth_cls.current}")
-        try:
-            mode_list[c_mode][0] = anim_list[str(wth_cls.id)]
-        except KeyError:
-            logger.warning(f"KeyError in anim_list: {wth_cls.id} does not exist")
-            mode_list[c_mode][0] = anim_list["def"]
+    return changed
 
 
-def cycle_lightning(c_mode, wth_id, mode_list, anim_list, next_update):
-    """If c_mode is 8 (lightning mode) or c_mode is 0 (weather mode) and current weather is T-Storms, cycle lightning animations."""
-    if (c_mode == 8) or (c_mode == 0 and str(wth_id)[0] == "2"):
-        now = monotonic()
-        if now >= next_update:
-            mode_list[c_mode][0] = anim_list[randint(0, (len(anim_list) - 1))]
-            next_update = now + randint(1, 5)
-        if mode_list[c_mode][0].cycle_count >= 3:
-            mode_list[c_mode][0].cycle_count = 0
-            mode_list[c_mode][0] = reset_strip
-    return next_update
+@myProfiler.staged("weather")
+def weather_advance(wth_cls):
+    """Step wth_cls along its forecast timeline, and return True if the weather has changed."""
+    if not wth_cls.advance():
+        return False
+    logger.debug(f"Changing whether animation: {wth_cls.current}")
+    return True
 
 
-def process_mode_change(c_mode, pressed, mode_list):
-    """If Mode or Numeric keys are pressed, this function processes that request and returns the new mode state and last mode state (or current if unchanged)"""
+def process_mode_change(c_mode, pressed, mode_list, count=1):
+    """If Mode or Numeric keys are pressed, this function processes that request (Mode count times) and returns the new mode state (or current if unchanged)"""
     if pressed not in ["Mode", "0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]:
         return c_mode
     if pressed == "Mode":
-        if c_mode == (len(mode_list) - 1):
-            new_mode = 0
-        else:
-            new_mode = c_mode + 1
+        new_mode = (c_mode + count) % len(mode_list)
     if pressed in ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]:
         new_mode = int(pressed)
     if pressed == "0" and c_mode == 0:
         logger.info("Forcing weather check . . .")
-        weather_check(c_mode, myWeather, mode_list, weather_anim, True)
+        myWorker.request()
     if new_mode != c_mode:
         logger.debug(f"Mode changed. prev {c_mode} new: {new_mode}")
-        reset_strip.animate()
-        mode_list[c_mode][0].reset()
         return new_mode
     else:
         logger.debug("Mode unchanged.")
         return c_mode
 
 
-def process_color_change(c_mode, pressed, mode_list):
-    """If Right or Left keys are pressed and current mode is not weather demo, process color change."""
+def key_action(c_mode, pressed):
+    """Returns the kind of action pressed has in c_mode, for the latency breakdown."""
+    if pressed in ["Mode", "0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]:
+        return "mode"
+    if pressed in ["Left", "Right"]:
+        return "pattern" if c_mode == 9 else "color"
+    if pressed in ["Up", "Down"]:
+        return "intensity"
+    if pressed == "Play":
+        return "startstop"
+    return "other"
+
+
+def process_color_change(c_mode, pressed, mode_list, renderer, count=1):
+    """If Right or Left keys are pressed and current mode is not weather demo, step the color count times, pass it to renderer and return True."""
     if (c_mode == 9) or not (
         (mode_list[c_mode][1] == "y") and (pressed in ["Right", "Left"])
     ):
-        return
+        return False
     if pressed == "Right":
-        myColor.next_color()
-        mode_list[c_mode][0].color = myColor.color
-        return
+        for _ in range(count):
+            myColor.next_color()
+        renderer.set_color(myColor.color)
+        return True
     elif pressed == "Left":
-        myColor.prev_color()
-        mode_list[c_mode][0].color = myColor.color
-        return
+        for _ in range(count):
+            myColor.prev_color()
+        renderer.set_color(myColor.color)
+        return True
     else:
         logger.warning(
             "In process_color_change - did not process color change correctly"
         )
-        return
+        return False
 
 
-def process_intensity_change(c_mode, pressed, mode_list):
+def process_intensity_change(c_mode, pressed, mode_list, count=1):
     if not ((mode_list[c_mode][2] == "y") and (pressed in ["Up", "Down"])):
         return
     if pressed == "Up":
-        myColor.inc_intensity()
-        mode_list[c_mode][0].color = myColor.color
+        myColor.inc_intensity(0.1 * count)
         return
     elif pressed == "Down":
-        myColor.dec_intensity()
-        mode_list[c_mode][0].color = myColor.color
+        myColor.dec_intensity(0.1 * count)
         return
     else:
         logger.warning(
@@ -195,32 +589,23 @@ def process_intensity_change(c_mode, pressed, mode_list):
         return
 
 
-def process_pattern_change(c_mode, pressed, mode_list, weather_list):
+def process_pattern_change(c_mode, pressed, cur_idx, weather_list, count=1):
+    """If Right or Left keys are pressed in weather demo mode, return the index into weather_list count patterns on (or cur_idx if unchanged)."""
     if not ((c_mode == 9) and (pressed in ["Left", "Right"])):
-        return
-    cur_idx = weather_list.index(mode_list[c_mode][0])
+        return cur_idx
     if pressed == "Right":
-        new_idx = cur_idx + 1
-        if new_idx > (len(weather_list) - 1):
-            new_idx = 0
-        mode_list[c_mode][0] = weather_list[new_idx]
-        return
+        return (cur_idx + count) % len(weather_list)
     elif pressed == "Left":
-        new_idx = cur_idx - 1
-        if new_idx < 0:
-            new_idx = len(weather_list) - 1
-        mode_list[c_mode][0] = weather_list[new_idx]
-        return
+        return (cur_idx - count) % len(weather_list)
     else:
         logger.warning(
             "In process_pattern_change - did not process pattern change correctly."
         )
-        return
+        return cur_idx
 
 
 def process_startstop(enabled):
     if enabled:
-        reset_strip.animate()
         return False
     elif not enabled:
         return True
@@ -232,6 +617,8 @@ def process_startstop(enabled):
 
 
 signal.signal(signal.SIGTERM, sigterm_handler)
+signal.signal(signal.SIGUSR1, sigusr1_handler)
+signal.signal(signal.SIGUSR2, sigusr2_handler)
 
 if __name__ == "__main__":
     logger.info("Starting main loop . . .")
@@ -0,0 +1,353 @@
+""" metrics v0.2
+Counters, gauges and fixed-bucket histograms for raspi-cloudlamp
+
+Metrics are created (or looked up) by name with counter(), gauge() and
+histogram(), and updated in place from the main loop without locks - an update
+is a few attribute increments, which the GIL keeps whole.  Bucket bounds are
+fixed when a histogram is created, so observing a value is a bisect and two
+increments, and percentiles are reported as the upper bound of the bucket they
+fall in.  Counters and gauges can instead be given a function that is called
+when they are read, for values another object already keeps.
+
+A name of the form "base.value" is exported as metric base with the label
+given to describe(base) set to value.  prometheus() renders every metric in the
+Prometheus text format, and MetricsServer serves it over HTTP from its own
+thread on a local port or UNIX socket, so a scrape never holds up the main loop.
+
+Use:
+    latency = metrics.histogram("input_latency")
+    latency.observe(0.012)
+    metrics.counter("frames").inc()
+    print(metrics.dump())
+    MetricsServer(9101).start()
+"""
+
+# Standard library imports
+import os
+import resource
+import socketserver
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from itertools import groupby
+
+from mylog import get_logger
+
+# Prefix of every exported metric name
+PREFIX = "cloudlamp_"
+
+# Bucket upper bounds in seconds, 1 ms to 5 s
+DEFAULT_BUCKETS = (
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+    5.0,
+)
+
+_histograms = {}
+_counters = {}
+_gauges = {}
+# base name -> (help text, label name)
+_descriptions = {}
+
+
+class Counter(object):
+    """Class for a count that only goes up
+
+    If fn is given, value is whatever fn() returns and inc() is not used.
+    """
+
+    __slots__ = ("name", "count", "fn")
+
+    def __init__(self, name, fn=None):
+        self.name = name
+        self.count = 0
+        self.fn = fn
+
+    def inc(self, amount=1):
+        self.count += amount
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self.count
+
+
+class Gauge(object):
+    """Class for a value that can go up and down
+
+    If fn is given, value is whatever fn() returns and set() is not used.
+    """
+
+    __slots__ = ("name", "current", "fn")
+
+    def __init__(self, name, fn=None):
+        self.name = name
+        self.current = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.current = value
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self.current
+
+
+class Histogram(object):
+    """Class for a histogram of values counted into fixed buckets
+
+    counts[i] is the number of values <= buckets[i] (and > buckets[i-1]), and
+    the last entry of counts is the number of values above every bucket.
+    """
+
+    __slots__ = ("name", "buckets", "counts", "count", "total", "max")
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, pct):
+        """ Returns the upper bound of the bucket holding the pct percentile, or max if it is above every bucket """
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def format(self):
+        """ Returns a one line summary of the histogram, with times in ms """
+        if not self.count:
+            return f"{self.name}: no samples"
+        return (
+            f"{self.name}: n={self.count} mean={self.mean * 1000:.1f} "
+            f"p50<={self.percentile(50) * 1000:.0f} p95<={self.percentile(95) * 1000:.0f} "
+            f"p99<={self.percentile(99) * 1000:.0f} max={self.max * 1000:.1f} ms"
+        )
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS):
+    """Returns the histogram called name, creating it with buckets if it doesn't exist yet."""
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = _histograms[name] = Histogram(name, buckets)
+    return hist
+
+
+def counter(name, fn=None):
+    """Returns the counter called name, creating it (read from fn if given) if it doesn't exist yet."""
+    metric = _counters.get(name)
+    if metric is None:
+        metric = _counters[name] = Counter(name, fn)
+    return metric
+
+
+def gauge(name, fn=None):
+    """Returns the gauge called name, creating it (read from fn if given) if it doesn't exist yet."""
+    metric = _gauges.get(name)
+    if metric is None:
+        metric = _gauges[name] = Gauge(name, fn)
+    return metric
+
+
+def describe(base, text, label=None):
+    """Sets the help text of the metrics called base, and the label their "base.value" names are exported with."""
+    _descriptions[base] = (text, label)
+
+
+def histograms():
+    """Returns every histogram, sorted by name."""
+    return [_histograms[name] for name in sorted(_histograms)]
+
+
+def dump():
+    """Returns a summary line for every histogram, followed by its non-empty buckets."""
+    lines = []
+    for hist in histograms():
+        lines.append(hist.format())
+        for bound, count in zip(hist.buckets + (float("inf"),), hist.counts):
+            if count:
+                lines.append(f"    <= {bound * 1000:g} ms: {count}")
+    return "\n".join(lines)
+
+
+def prometheus():
+    """Returns every metric, and the process CPU time and resident memory, in the Prometheus text format."""
+    lines = []
+    for base, metrics in _families(_counters):
+        lines.extend(_header(base, "_total", "counter"))
+        for metric in metrics:
+            lines.append(
+                f"{PREFIX}{_name(base)}_total{_labels(metric.name)} {metric.value}"
+            )
+    for base, metrics in _families(_gauges):
+        lines.extend(_header(base, "", "gauge"))
+        for metric in metrics:
+            lines.append(f"{PREFIX}{_name(base)}{_labels(metric.name)} {metric.value}")
+    for base, hists in _families(_histograms):
+        lines.extend(_header(base, "_seconds", "histogram"))
+        name = f"{PREFIX}{_name(base)}_seconds"
+        for hist in hists:
+            # Copy the counts first, so the buckets add up if the main loop observes meanwhile
+            counts = list(hist.counts)
+            seen = 0
+            for bound, count in zip(hist.buckets + (float("inf"),), counts):
+                seen += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_labels(hist.name, le)} {seen}")
+            lines.append(f"{name}_sum{_labels(hist.name)} {hist.total}")
+            lines.append(f"{name}_count{_labels(hist.name)} {seen}")
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    lines.append("# HELP process_cpu_seconds_total User and system CPU time spent.")
+    lines.append("# TYPE process_cpu_seconds_total counter")
+    lines.append(f"process_cpu_seconds_total {usage.ru_utime + usage.ru_stime}")
+    lines.append("# HELP process_resident_memory_bytes Resident memory size.")
+    lines.append("# TYPE process_resident_memory_bytes gauge")
+    lines.append(f"process_resident_memory_bytes {_rss(usage)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer(object):
+    """Class used to serve prometheus() over HTTP on a background thread
+
+    address is a TCP port on localhost, or the path of a UNIX socket.  Requests
+    are answered one at a time on the server's own thread, which only reads the
+    metrics, so a slow or stuck client can delay other scrapes but never the
+    main loop.
+
+    Use:
+        server = MetricsServer(9101)
+        server.start()
+        ...
+        server.close()
+    """
+
+    def __init__(self, address):
+        self.log = get_logger(__name__ + ".MetricsServer")
+        self.address = address
+        self.scrapes = 0
+        if isinstance(address, int):
+            self._server = _TCPServer(("127.0.0.1", address), _MetricsHandler)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            self._server = _UnixServer(address, _MetricsHandler)
+        self._server.metrics_server = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="MetricsServer", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        self.log.info(f"MetricsServer listening on {self.address}.")
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=1)
+        if not isinstance(self.address, int):
+            os.unlink(self.address)
+        self.log.info("MetricsServer stopped.")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    # Drop clients that stall instead of holding the server thread
+    timeout = 5
+
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus().encode()
+        self.server.metrics_server.scrapes += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # UNIX socket clients have no address
+        return str(self.client_address or "local")
+
+    def log_message(self, format, *args):
+        self.server.metrics_server.log.debug(format % args)
+
+
+class _TCPServer(HTTPServer):
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.UnixStreamServer):
+    pass
+
+
+def _families(registry):
+    """Yields (base, metrics) for the metrics in registry, grouped by base name."""
+    # Copied in one step, so metrics created meanwhile by another thread are left for the next scrape
+    metrics = sorted(registry.values(), key=lambda metric: metric.name)
+    return groupby(metrics, key=lambda metric: metric.name.partition(".")[0])
+
+
+def _header(base, suffix, kind):
+    name = f"{PREFIX}{_name(base)}{suffix}"
+    text = _descriptions.get(base, (base, None))[0]
+    return [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+
+
+def _name(base):
+    return base.replace(".", "_").replace("-", "_")
+
+
+def _labels(name, le=None):
+    """Returns the label set of the metric called name (plus le for histogram buckets)."""
+    base, _, value = name.partition(".")
+    labels = []
+    if value:
+        label = _descriptions.get(base, (None, None))[1] or "key"
+        labels.append(f'{label}="{value}"')
+    if le is not None:
+        labels.append(f'le="{le}"')
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _rss(usage):
+    """Returns the resident memory of this process in bytes, or its peak if /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return usage.ru_maxrss * 1024
@@ -0,0 +1,232 @@
+""" profiler v0.1
+On-demand profiler for raspi-cloudlamp
+
+A Profiler does nothing until start() (or toggle(), e.g. from a signal
+handler) opens a profiling window.  During the window:
+
+  * Stages - functions decorated with staged(name) and the methods given as
+    targets - are timed.  Methods are only wrapped while the window is open, so
+    the hot path runs unwrapped the rest of the time.  Each stage's self time is
+    added to its stack of enclosing stages, e.g. "frame;Scene.animate;Comet.draw"
+    (methods are labelled with the class of the instance they are called on).
+  * If sample_hz is set, a thread samples the main thread's Python stack
+    sample_hz times a second.
+
+When the window closes (at the end of the first stage after window seconds, or
+on stop()) the results are written to directory in the collapsed stack format
+read by flamegraph.pl and speedscope:
+
+    profile-<time>.stages.folded    stage stacks and microseconds of self time
+    profile-<time>.samples.folded   sampled stacks and sample counts
+
+Use:
+    prof = Profiler(targets=[(Animation, ("animate", "draw"))])
+
+    @prof.staged("frame")
+    def draw_frame():
+        ...
+
+    prof.toggle()
+"""
+
+# Standard library imports
+import os
+import sys
+import tempfile
+import threading
+from functools import wraps
+from time import perf_counter, strftime
+
+from mylog import get_logger
+
+
+class Profiler(object):
+    """Class for a profiling window over the main loop
+
+    :param float window: Seconds to profile for once started (Default 10.0).
+    :param float sample_hz: Stack samples per second, or 0 for no sampling (Default 0).
+    :param str directory: Directory results are written to (Default the temp directory).
+    :param targets: (class, method names) pairs to time as stages.  Every
+                    subclass that defines one of the methods is timed too.
+    """
+
+    def __init__(self, window=10.0, sample_hz=0, directory=None, targets=()):
+        self.log = get_logger(__name__ + ".Profiler")
+        self.window = window
+        self.sample_hz = sample_hz
+        self.directory = tempfile.gettempdir() if directory is None else directory
+        self.targets = targets
+        self.active = False
+        self.last_paths = None
+        self._deadline = 0.0
+        self._stack = []
+        self._stages = {}
+        self._samples = {}
+        self._patched = []
+        self._sampler = None
+        self._sampling = threading.Event()
+
+    def staged(self, name):
+        """ Returns a decorator timing the function as stage name while profiling """
+        return lambda func: self._timed(name, func)
+
+    def toggle(self):
+        """ Starts a profiling window, or ends the current one early """
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if self.active:
+            return
+        self._stack = []
+        self._stages = {}
+        self._samples = {}
+        self._patch()
+        self._deadline = perf_counter() + self.window
+        self.active = True
+        if self.sample_hz > 0:
+            self._sampling.clear()
+            self._sampler = threading.Thread(
+                target=self._sample,
+                args=(threading.main_thread().ident,),
+                name="ProfilerSampler",
+                daemon=True,
+            )
+            self._sampler.start()
+        self.log.info(
+            f"Profiling for {self.window:.0f}s ({len(self._patched)} methods timed, {self.sample_hz} Hz sampling)"
+        )
+
+    def stop(self):
+        """ Ends the profiling window and writes the results """
+        if not self.active:
+            return
+        self.active = False
+        self._unpatch()
+        if self._sampler is not None:
+            self._sampling.set()
+            self._sampler.join(timeout=1)
+            self._sampler = None
+        self._stack = []
+        self.last_paths = self._write()
+
+    def _record(self, stage, elapsed):
+        """ Adds the self time of stage, the top of the stack, and pops it """
+        key = ";".join(entry.name for entry in self._stack)
+        self._stages[key] = self._stages.get(key, 0.0) + elapsed - stage.child
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1].child += elapsed
+        elif perf_counter() >= self._deadline:
+            self.stop()
+
+    def _patch(self):
+        for base, names in self.targets:
+            for cls in _subclasses(base):
+                for name in names:
+                    func = cls.__dict__.get(name)
+                    if func is None:
+                        continue
+                    setattr(cls, name, self._timed_method(name, func))
+                    self._patched.append((cls, name, func))
+
+    def _unpatch(self):
+        for cls, name, func in self._patched:
+            setattr(cls, name, func)
+        self._patched = []
+
+    def _timed(self, label, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.active:
+                return func(*args, **kwargs)
+            with _Stage(self, label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def _timed_method(self, name, func):
+        """ Like _timed, but labels each call with the class of the instance it is called on """
+
+        @wraps(func)
+        def wrapper(obj, *args, **kwargs):
+            if not self.active:
+                return func(obj, *args, **kwargs)
+            with _Stage(self, f"{type(obj).__name__}.{name}"):
+                return func(obj, *args, **kwargs)
+
+        return wrapper
+
+    def _sample(self, ident):
+        interval = 1.0 / self.sample_hz
+        while not self._sampling.wait(interval):
+            frame = sys._current_frames().get(ident)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            key = ";".join(reversed(names))
+            self._samples[key] = self._samples.get(key, 0) + 1
+
+    def _write(self):
+        """ Writes the collapsed stacks and returns the paths written """
+        prefix = os.path.join(self.directory, f"profile-{strftime('%Y%m%d-%H%M%S')}")
+        paths = []
+        results = [("stages", self._stages, 1e6)]
+        if self._samples:
+            results.append(("samples", self._samples, 1))
+        try:
+            for kind, stacks, scale in results:
+                path = f"{prefix}.{kind}.folded"
+                with open(path, "w") as out:
+                    for key in sorted(stacks):
+                        value = round(stacks[key] * scale)
+                        if value > 0:
+                            out.write(f"{key} {value}\n")
+                paths.append(path)
+        except OSError as e:
+            self.log.error(f"Writing the profile failed:\n {e}")
+        self.log.info(f"Profile written to {', '.join(paths)}")
+        return paths
+
+
+class _Stage(object):
+    """ Context manager timing one call of a stage while profiling """
+
+    __slots__ = ("profiler", "name", "start", "child")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.child = 0.0
+
+    def __enter__(self):
+        self.profiler._stack.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        stack = self.profiler._stack
+        # A window that ended (or started) inside this stage doesn't record it
+        if self.profiler.active and stack and stack[-1] is self:
+            self.profiler._record(self, elapsed)
+        return False
+
+
+def _subclasses(base):
+    """ Yields base and every class derived from it """
+    seen = set()
+    pending = [base]
+    while pending:
+        cls = pending.pop()
+        if cls in seen:
+            continue
+        seen.add(cls)
+        yield cls
+        pending.extend(cls.__subclasses__())
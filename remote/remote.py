@@ -1,11 +1,26 @@
-""" remote v0.2
+""" remote v0.3
 Remote handler for raspi-cloudlamp
 """
 
 # Imports
-from evdev import InputDevice, categorize, ecodes
+import os
+import selectors
+import threading
+import time
+from collections import deque, namedtuple
+from time import perf_counter
+
+from evdev import InputDevice, ecodes
 from mylog import get_logger
 
+# evdev key event values
+KEY_UP = 0
+KEY_DOWN = 1
+KEY_REPEAT = 2
+
+# A decoded key release (or accelerated repeat while held), with its kernel timestamp
+KeyPress = namedtuple("KeyPress", ["action", "timestamp", "count", "repeat"])
+
 
 class IRRemote(object):
     """Class for the IRRemote object
@@ -33,15 +48,39 @@ class IRRemote(object):
                         the value being the friendly button name
         param:protocol  The protocol that the remote should be using to decode
                         the pulses. Default is NEC
+        param:input_device  Path of the evdev input device, or an already
+                        opened InputDevice (or SimulatedInputDevice)
         """
 
         self.log = get_logger(__name__ + ".IRRemote")
         self._event = None
         self.pressed = None
         self.mapping = mapping
-        self._device = InputDevice(input_device)
+        self.decodes = 0
+        self.unmapped = 0
+        self.last_decode_time = 0.0
+        self.total_decode_time = 0.0
+        if isinstance(input_device, str):
+            input_device = InputDevice(input_device)
+        self._device = input_device
         self.log.info("Created instance of IRRemote Class.")
 
+    @property
+    def mapping(self):
+        """ The dictionary of evdev key name to friendly button name """
+        return self._mapping
+
+    @mapping.setter
+    def mapping(self, value):
+        self._mapping = value
+        # Keycode lookup table, so decoding a key event is a single dict lookup
+        self._actions = {}
+        for name, action in value.items():
+            if name in ecodes.ecodes:
+                self._actions[ecodes.ecodes[name]] = action
+            else:
+                self.log.warning(f"Unknown key name {name} in mapping - ignored")
+
     @property
     def pressed(self):
         """ Returns the name of the key pressed as a string based on the provided mapping """
@@ -56,21 +95,203 @@ class IRRemote(object):
         """ Checks to see if a remote button press was recieved and returns True if so """
         evt = self._device.read_one()
         while evt is not None:
-            if evt.type != ecodes.EV_KEY:
-                evt = self._device.read_one()
-                continue
-            event = str(categorize(evt))
-            self.log.debug(f"Recieved valid event: {event}")
-            if "up" in event[-2:]:
-                self.pressed = self.mapping[
-                    event.split()[5].strip(",").strip("(").strip(")")
-                ]
-                return True
+            if evt.type == ecodes.EV_KEY and evt.value == KEY_UP:
+                action = self.decode(evt.code)
+                if action is not None:
+                    self.pressed = action
+                    return True
 
             evt = self._device.read_one()
 
         return False
 
+    def decode(self, code):
+        """ Returns the button name mapped to the keycode code, or None if it isn't mapped """
+        start = perf_counter()
+        action = self._actions.get(code)
+        elapsed = perf_counter() - start
+        self.decodes += 1
+        self.last_decode_time = elapsed
+        self.total_decode_time += elapsed
+        if action is None:
+            self.unmapped += 1
+            self.log.debug(f"Ignoring unmapped keycode {code}")
+        return action
+
+    @property
+    def average_decode_time(self):
+        """ Returns the mean time spent decoding a key release, in seconds """
+        return self.total_decode_time / self.decodes if self.decodes else 0.0
+
+    @property
+    def device(self):
+        return self._device
+
+    def fileno(self):
+        """ Returns the file descriptor of the input device so it can be waited on with select """
+        return self._device.fileno()
+
     def close(self):
         self._device.close()
         self.log.info("Closed connection to IR device.")
+
+
+class RemoteReader(object):
+    """Class used to read an IRRemote's input device on a background thread
+
+    Key releases are decoded as they arrive and queued as KeyPress tuples with
+    the kernel timestamp of the event.  Holding a repeatable key (Up, Down, Left,
+    Right) queues repeats once it has been held for repeat_delay seconds, at most
+    every repeat_interval seconds, with a count that grows by one every
+    accel_time seconds of holding up to max_count.  A byte is written to a pipe
+    for each queued press so the main loop can wait on the reader with select.
+    The queue holds at most maxsize presses; the oldest are dropped beyond that.
+
+    Use:
+        reader = RemoteReader(remote)
+        reader.start()
+        selector.register(reader, selectors.EVENT_READ)
+        for action, count, timestamp in coalesce(reader.completed()):
+            ...
+    """
+
+    def __init__(
+        self,
+        remote,
+        maxsize=32,
+        repeatable=("Up", "Down", "Left", "Right"),
+        repeat_delay=0.5,
+        repeat_interval=0.15,
+        accel_time=1.0,
+        max_count=4,
+    ):
+        self.log = get_logger(__name__ + ".RemoteReader")
+        self.remote = remote
+        self.repeatable = repeatable
+        self.repeat_delay = repeat_delay
+        self.repeat_interval = repeat_interval
+        self.accel_time = accel_time
+        self.max_count = max_count
+        self.presses = 0
+        self.dropped = 0
+        self.last_latency = None
+        self._queue = deque(maxlen=maxsize)
+        self._held = None
+        self._held_since = 0.0
+        self._last_repeat = 0.0
+        self._repeated = False
+        self._read_fd, self._write_fd = os.pipe()
+        self._stop_read_fd, self._stop_write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        self._thread = threading.Thread(
+            target=self._run, name="RemoteReader", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        self.log.info("RemoteReader started.")
+
+    def completed(self):
+        """ Yields the queued KeyPresses, oldest first, without blocking """
+        try:
+            while os.read(self._read_fd, 64):
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            try:
+                yield self._queue.popleft()
+            except IndexError:
+                return
+
+    def fileno(self):
+        """ Returns the file descriptor that becomes readable when a key press is queued """
+        return self._read_fd
+
+    def close(self):
+        os.write(self._stop_write_fd, b"\0")
+        self._thread.join(timeout=1)
+        for fd in (
+            self._read_fd,
+            self._write_fd,
+            self._stop_read_fd,
+            self._stop_write_fd,
+        ):
+            os.close(fd)
+        self.log.info("RemoteReader stopped.")
+
+    def _run(self):
+        device = self.remote.device
+        selector = selectors.DefaultSelector()
+        selector.register(device, selectors.EVENT_READ)
+        selector.register(self._stop_read_fd, selectors.EVENT_READ)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj == self._stop_read_fd:
+                        return
+                evt = device.read_one()
+                while evt is not None:
+                    if evt.type == ecodes.EV_KEY:
+                        self._key_event(evt)
+                    evt = device.read_one()
+        except OSError as e:
+            self.log.error(f"Reading the IR device failed:\n {e}")
+        finally:
+            selector.close()
+
+    def _key_event(self, evt):
+        timestamp = evt.timestamp()
+        if evt.value == KEY_DOWN:
+            self._held = evt.code
+            self._held_since = timestamp
+            self._last_repeat = timestamp
+            self._repeated = False
+        elif evt.value == KEY_REPEAT:
+            if evt.code != self._held:
+                return
+            held = timestamp - self._held_since
+            if (
+                held < self.repeat_delay
+                or timestamp - self._last_repeat < self.repeat_interval
+            ):
+                return
+            action = self.remote.decode(evt.code)
+            if action not in self.repeatable:
+                return
+            count = min(
+                self.max_count, 1 + int((held - self.repeat_delay) / self.accel_time)
+            )
+            self._last_repeat = timestamp
+            self._repeated = True
+            self._put(KeyPress(action, timestamp, count, True))
+        elif evt.value == KEY_UP:
+            repeated = self._repeated and evt.code == self._held
+            self._held = None
+            self._repeated = False
+            # A held key has already been applied by its repeats
+            if repeated:
+                return
+            action = self.remote.decode(evt.code)
+            if action is not None:
+                self._put(KeyPress(action, timestamp, 1, False))
+
+    def _put(self, press):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(press)
+        self.presses += 1
+        self.last_latency = time.time() - press.timestamp
+        os.write(self._write_fd, b"\0")
+
+
+def coalesce(presses):
+    """Returns a list of [action, count, timestamp] for the KeyPresses presses, merging runs of the same action into one entry with the timestamp of its first press."""
+    merged = []
+    for press in presses:
+        if merged and merged[-1][0] == press.action:
+            merged[-1][1] += press.count
+        else:
+            merged.append([press.action, press.count, press.timestamp])
+    return merged
@@ -0,0 +1,79 @@
+""" simulated v0.1
+In-memory stand-in for the IR remote input device
+"""
+
+# Imports
+import os
+import time
+from collections import deque
+
+from evdev import InputEvent, ecodes
+
+
+class SimulatedInputDevice(object):
+    """Class for an in-memory stand-in of evdev.InputDevice
+
+    Events queued with press() or inject() are returned by read_one(), and the
+    device fd is readable while events are queued so it can be used with select.
+
+    Use:
+        device = SimulatedInputDevice()
+        remote = IRRemote(mapping, device)
+        device.press("KEY_UP")
+    """
+
+    def __init__(self, path="simulated"):
+        self.path = path
+        self.name = "Simulated IR remote"
+        self._events = deque()
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+    @property
+    def fd(self):
+        return self._read_fd
+
+    def fileno(self):
+        return self._read_fd
+
+    def inject(self, etype, code, value, timestamp=None):
+        """ Queues a single event with timestamp (default the current time) """
+        if timestamp is None:
+            timestamp = time.time()
+        sec = int(timestamp)
+        self._events.append(
+            InputEvent(sec, int((timestamp - sec) * 1e6), etype, code, value)
+        )
+        os.write(self._write_fd, b"\0")
+
+    def press(self, keycode):
+        """ Queues the key down, key up and sync events of a key press, e.g. press("KEY_UP") """
+        code = ecodes.ecodes[keycode]
+        self.inject(ecodes.EV_KEY, code, 1)
+        self.inject(ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+        self.inject(ecodes.EV_KEY, code, 0)
+        self.inject(ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+
+    def hold(self, keycode, duration, rate=0.11):
+        """ Queues the events of holding a key for duration seconds, with kernel repeats every rate seconds """
+        code = ecodes.ecodes[keycode]
+        start = time.time()
+        self.inject(ecodes.EV_KEY, code, 1, start)
+        self.inject(ecodes.EV_SYN, ecodes.SYN_REPORT, 0, start)
+        held = rate
+        while held < duration:
+            self.inject(ecodes.EV_KEY, code, 2, start + held)
+            self.inject(ecodes.EV_SYN, ecodes.SYN_REPORT, 0, start + held)
+            held += rate
+        self.inject(ecodes.EV_KEY, code, 0, start + duration)
+        self.inject(ecodes.EV_SYN, ecodes.SYN_REPORT, 0, start + duration)
+
+    def read_one(self):
+        if not self._events:
+            return None
+        os.read(self._read_fd, 1)
+        return self._events.popleft()
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
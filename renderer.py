@@ -0,0 +1,575 @@
+""" renderer v0.1
+Renders the lamp's animations, in the main process or in a render process
+
+Renderer owns everything that draws to pixels - the current mode and its
+animation, the weather and lightning animations, crossfades, output intensity -
+and runs the frame and lightning jobs on a Scheduler.  The main loop changes
+what is rendered through set_mode(), set_color(), set_intensity(), set_weather(),
+set_pattern(), set_enabled() and refresh().
+
+sync(epoch, seed) starts a scene phase, used to keep several lamps in step (see
+sync): frames are drawn on a grid of periods from epoch (a time.monotonic()
+time), each frame is drawn with the random module seeded from seed and the
+number of frames drawn since epoch (or the last lightning pick), and lightning is picked from a generator
+seeded with seed at fixed times after epoch.  Two renderers synced to the same
+epoch and seed draw the same frames at the same times.
+
+RenderProcess has the same methods, but forks a render process that runs a
+Renderer on its own scheduler and applies the calls sent to it over a pipe, so
+garbage collection, logging and input handling in the main process can't delay
+a frame (and each process can be pinned to a CPU or given its own priority).
+The render process publishes its stats, frame time histogram and the last
+frame drawn in a SharedState (multiprocessing.shared_memory, Python 3.8+), read
+without locks, and the frame_time metric of the main process is kept up to date
+from it whenever stats() is read.
+
+Use:
+    renderer = Renderer(scheduler, weather.id, governor)
+    # or
+    renderer = RenderProcess(weather.id, governor)
+    selector.register(renderer, selectors.EVENT_READ)
+
+    renderer.set_mode(3)
+    renderer.refresh()
+"""
+
+# Standard library imports
+import gc
+import multiprocessing
+import os
+import random
+import selectors
+import signal
+from time import monotonic, perf_counter, time
+
+import numpy as np
+
+from adafruit_led_animation import MS_PER_SECOND, monotonic_ms
+
+# Application library imports
+import metrics
+from mylog import get_logger
+from scheduler import Scheduler
+from cloud_animations import pixels
+from cloud_animations.animations import wth_list, mode, reset_strip, weather_anim
+from cloud_animations.lightning_animations import lightning_list
+from cloud_animations.timing import leaves, next_frame_in
+
+# Seconds to crossfade over on a mode change, and between crossfade frames
+FADE_TIME = 0.5
+FADE_STEP = 0.02
+
+# Bucket upper bounds in seconds for the frame time histogram
+FRAME_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2)
+
+# Values returned by stats(), in the order they are kept in a SharedState
+STATS = (
+    "drawn",
+    "written",
+    "suppressed",
+    "skipped",
+    "throttled",
+    "idled",
+    "slowdown",
+    "cpu",
+    "lightning",
+)
+
+# Values of the frame time histogram kept in a SharedState - its counts, then count, total and max
+HISTOGRAM_SIZE = len(FRAME_BUCKETS) + 4
+
+# Attempts to read a SharedState between writes before the last complete read is used instead
+READ_RETRIES = 1000
+
+
+class Renderer(object):
+    """Class for the lamp's frame and lightning jobs
+
+    :param scheduler: The Scheduler the jobs run on.
+    :param weather_id: The current openweathermap condition code.
+    :param governor: The Governor the mode animation is animated through.
+    :param profiler: The Profiler the jobs are staged on, or None.
+    """
+
+    def __init__(self, scheduler, weather_id, governor, profiler=None):
+        self.log = get_logger(__name__ + ".Renderer")
+        self.scheduler = scheduler
+        self.governor = governor
+        self.profiler = profiler
+        self.mode = 0
+        self.enabled = True
+        self.drawn = 0
+        self.lightning = 0
+        self.seed = None
+        self._frames = 0
+        self._lightning_at = 0.0
+        self._lightning_random = random.Random()
+        self._frame_time = metrics.histogram("frame_time", FRAME_BUCKETS)
+        staged = profiler.staged if profiler is not None else _unstaged
+        self._frame_timer = scheduler.call_later(0, staged("frame")(self._draw_frame))
+        self._lightning_timer = scheduler.call_later(
+            0, staged("lightning")(self._next_lightning)
+        )
+        reset_strip.animate()
+        self.set_weather(weather_id)
+
+    def set_mode(self, new_mode):
+        """ Switches to mode new_mode, crossfading out of the current one """
+        if new_mode == self.mode:
+            return
+        prev_mode = self.mode
+        self.mode = new_mode
+        pixels.crossfade(FADE_TIME)
+        reset_strip.animate()
+        mode[prev_mode][0].reset()
+
+    def set_color(self, color):
+        """ Sets the color of the current mode's animation """
+        mode[self.mode][0].color = color
+
+    def set_intensity(self, intensity):
+        """ Outputs at intensity if the current mode can change intensity, otherwise at full intensity """
+        pixels.intensity = intensity if mode[self.mode][2] == "y" else 1.0
+        # Rewrite the current frame with the new table (skipped if it didn't change)
+        pixels.show()
+
+    def set_weather(self, weather_id):
+        """ Sets the weather mode (0) animation to the one for the condition code weather_id """
+        self.weather_id = weather_id
+        try:
+            mode[0][0] = weather_anim[str(weather_id)]
+        except KeyError:
+            self.log.warning(f"KeyError in weather_anim: {weather_id} does not exist")
+            mode[0][0] = weather_anim["def"]
+
+    def set_pattern(self, index):
+        """ Sets the weather demo mode (9) animation to wth_list[index] """
+        mode[9][0] = wth_list[index]
+
+    def set_enabled(self, enabled):
+        """ Turns the lamp on or off (blanking the strip) """
+        if self.enabled and not enabled:
+            reset_strip.animate()
+        self.enabled = enabled
+
+    def refresh(self):
+        """ Reschedules the frame and lightning jobs after the lamp state changes """
+        if not self.enabled:
+            self.scheduler.cancel(self._frame_timer)
+            self.scheduler.cancel(self._lightning_timer)
+            return
+        self.governor.wake(mode[self.mode][0])
+        self.scheduler.reschedule(self._frame_timer, 0)
+        if not self.lightning_active():
+            self.scheduler.cancel(self._lightning_timer)
+        elif not self._lightning_timer.active:
+            self._lightning_at = max(self._lightning_at, monotonic())
+            self.scheduler.reschedule(
+                self._lightning_timer, self._lightning_at - monotonic()
+            )
+
+    def sync(self, epoch, seed):
+        """ Restarts the current scene as if it had started at epoch with seed, aligning frames and lightning to it """
+        self.seed = seed
+        self._frames = 0
+        animation = mode[self.mode][0]
+        # Animations may pick at random on reset, too
+        self._seed("reset")
+        _restart(animation)
+        self.governor.wake(animation)
+        # Replay the lightning picks already made since epoch
+        self._lightning_random.seed(seed)
+        self._lightning_at = epoch
+        self.lightning = 0
+        if self.enabled and self.lightning_active():
+            now = monotonic()
+            while self._lightning_at <= now:
+                index, delay = self._pick_lightning()
+                epoch = self._lightning_at
+                self._lightning_at += delay
+                self.lightning += 1
+            if self.lightning:
+                mode[self.mode][0] = animation = lightning_list[index]
+                self._seed(f"lightning/{self.lightning}")
+                _restart(animation)
+                pixels.fill(0)
+            self.scheduler.reschedule(
+                self._lightning_timer, self._lightning_at - monotonic()
+            )
+        # Draw the frame due on the grid from epoch (or the last lightning pick) most recently,
+        # which is the first one unless joining late
+        epoch_ms = epoch * MS_PER_SECOND
+        now_ms = monotonic_ms()
+        for leaf in leaves(animation):
+            period = self.governor.period(leaf)
+            ticks = max(0, (now_ms - epoch_ms) // period)
+            leaf._next_update = epoch_ms + ticks * period
+        if self.enabled:
+            self.scheduler.reschedule(self._frame_timer, 0)
+
+    def add_show_receiver(self, callback):
+        """ Adds a callback called with the time each frame is written to the strip """
+        pixels.add_show_receiver(lambda _pixels: callback(time()))
+
+    def lightning_active(self):
+        """ Returns True in lightning mode (8), or in weather mode (0) during T-Storms """
+        return (self.mode == 8) or (self.mode == 0 and str(self.weather_id)[0] == "2")
+
+    def stats(self):
+        """ Returns a dict of the STATS counters """
+        return {
+            "drawn": self.drawn,
+            "written": pixels.shown,
+            "suppressed": pixels.suppressed,
+            "skipped": self.governor.skipped,
+            "throttled": self.governor.throttled,
+            "idled": self.governor.idled,
+            "slowdown": self.governor.slowdown,
+            "cpu": self.governor.cpu,
+            "lightning": self.lightning,
+        }
+
+    def toggle_profiler(self):
+        if self.profiler is not None:
+            self.profiler.toggle()
+
+    def log_metrics(self):
+        self.log.info(f"Histograms:\n{metrics.dump()}")
+
+    def close(self):
+        pixels.fill(0)
+        pixels.show()
+
+    def _draw_frame(self):
+        start = perf_counter()
+        if self.seed is not None:
+            self._seed(f"frame/{self.lightning}/{self._frames}")
+        if self.governor.animate(mode[self.mode][0]):
+            self._frames += 1
+            drawn = True
+        else:
+            # Nothing due yet - unless a crossfade is still moving
+            drawn = pixels.fading
+            if drawn:
+                pixels.show()
+        if drawn:
+            self._frame_time.observe(perf_counter() - start)
+            self.drawn += 1
+        if self.lightning_active():
+            self._end_lightning()
+        delay = next_frame_in(mode[self.mode][0])
+        if pixels.fading:
+            delay = FADE_STEP if delay is None else min(delay, FADE_STEP)
+        self.scheduler.reschedule(self._frame_timer, delay)
+
+    def _next_lightning(self):
+        """ Swaps a random lightning animation into the current mode, and picks the next one 1-5 seconds after this one was due """
+        index, delay = self._pick_lightning()
+        self.lightning += 1
+        mode[self.mode][0] = lightning_list[index]
+        if self.seed is not None:
+            self._seed(f"lightning/{self.lightning}")
+            _restart(lightning_list[index])
+            # Lightning draws over part of the strip, so start every lamp from the same blank one
+            pixels.fill(0)
+            self._frames = 0
+            # Due when it was picked for, rather than when the timer fired
+            for leaf in leaves(lightning_list[index]):
+                leaf._next_update = self._lightning_at * MS_PER_SECOND
+        self._lightning_at += delay
+        self.scheduler.reschedule(
+            self._lightning_timer, max(0, self._lightning_at - monotonic())
+        )
+        self.scheduler.reschedule(self._frame_timer, 0)
+
+    def _pick_lightning(self):
+        """ Returns the index into lightning_list of the next lightning animation and the seconds until the one after """
+        index = self._lightning_random.randrange(len(lightning_list))
+        return index, self._lightning_random.randint(1, 5)
+
+    def _seed(self, event):
+        """ Seeds random from seed and event, so every synced renderer makes the same picks for it """
+        random.seed(f"{self.seed}/{event}")
+
+    def _end_lightning(self):
+        """ Blanks the strip once the current lightning animation has run 3 cycles, until the next one is picked """
+        if mode[self.mode][0].cycle_count >= 3:
+            mode[self.mode][0].cycle_count = 0
+            mode[self.mode][0] = reset_strip
+
+
+class SharedState(object):
+    """Class for the render process stats and frame, in shared memory
+
+    Written by the render process only.  A sequence number is made odd while a
+    write is in progress, so readers retry instead of taking a lock - up to
+    READ_RETRIES times, after which (e.g. if the render process died mid-write)
+    the last complete read is returned and counted in torn.
+    """
+
+    def __init__(self, n):
+        # Python 3.8+, only needed with a render process
+        from multiprocessing import shared_memory
+
+        self.log = get_logger(__name__ + ".SharedState")
+        self.n = n
+        self.torn = 0
+        self._last = {}
+        # Named here - the default name comes from the secrets module, which the lamp's secrets.py shadows
+        self._shm = shared_memory.SharedMemory(
+            name=f"cloudlamp-{os.getpid()}",
+            create=True,
+            size=8 * (len(STATS) + HISTOGRAM_SIZE + 1) + 3 * n,
+        )
+        self.name = self._shm.name
+        self._seq = np.ndarray(1, dtype=np.uint64, buffer=self._shm.buf)
+        self._stats = np.ndarray(
+            len(STATS), dtype=np.float64, buffer=self._shm.buf, offset=8
+        )
+        self._histogram = np.ndarray(
+            HISTOGRAM_SIZE,
+            dtype=np.float64,
+            buffer=self._shm.buf,
+            offset=8 * (len(STATS) + 1),
+        )
+        self._frame = np.ndarray(
+            3 * n,
+            dtype=np.uint8,
+            buffer=self._shm.buf,
+            offset=8 * (len(STATS) + HISTOGRAM_SIZE + 1),
+        )
+
+    def publish(self, stats, frame=None, frame_time=None):
+        """ Writes the stats dict (and the RGB bytes frame and frame time Histogram if given) """
+        self._seq[0] += 1
+        self._stats[:] = [stats[name] for name in STATS]
+        if frame_time is not None:
+            self._histogram[:-3] = frame_time.counts
+            self._histogram[-3:] = (frame_time.count, frame_time.total, frame_time.max)
+        if frame is not None:
+            self._frame[:] = np.frombuffer(frame, dtype=np.uint8)
+        self._seq[0] += 1
+
+    def stats(self):
+        """ Returns the last stats published, as a dict """
+        values = self._read(self._stats, "stats")
+        return dict(zip(STATS, values.tolist()))
+
+    def frame_time(self, histogram):
+        """ Copies the last frame time histogram published into the Histogram histogram """
+        values = self._read(self._histogram, "histogram").tolist()
+        histogram.counts = [int(count) for count in values[:-3]]
+        histogram.count = int(values[-3])
+        histogram.total, histogram.max = values[-2:]
+
+    def frame(self):
+        """ Returns the RGB bytes of the last frame published """
+        return self._read(self._frame, "frame").tobytes()
+
+    def close(self, unlink=False):
+        del self._seq, self._stats, self._histogram, self._frame
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+    def _read(self, values, name):
+        for _ in range(READ_RETRIES):
+            seq = int(self._seq[0])
+            if seq % 2 == 0:
+                copy = values.copy()
+                if int(self._seq[0]) == seq:
+                    self._last[name] = copy
+                    return copy
+        if not self.torn:
+            self.log.warning(
+                "Render process stopped mid-write - using the last stats read."
+            )
+        self.torn += 1
+        last = self._last.get(name)
+        return last if last is not None else values.copy()
+
+
+class RenderProcess(object):
+    """Class used to run a Renderer in a render process
+
+    Takes the arguments of Renderer, less the scheduler, plus:
+    :param int cpu: CPU to pin the render process to, or None.
+    :param int priority: Nice value of the render process, or None.
+
+    Must be created before any thread is started, as it forks.  Calls are sent
+    over a pipe and applied in order.  After each batch of calls the render
+    process reports the time of the next frame it writes, which is passed to the
+    show receivers when receive() reads it.
+    """
+
+    def __init__(self, weather_id, governor, profiler=None, cpu=None, priority=None):
+        self.log = get_logger(__name__ + ".RenderProcess")
+        self.alive = True
+        self.shared = SharedState(len(pixels))
+        # Observed in the render process - the one in this process is copied from shared
+        self._frame_time = metrics.histogram("frame_time", FRAME_BUCKETS)
+        self._receivers = []
+        context = multiprocessing.get_context("fork")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_serve,
+            args=(
+                child_conn,
+                self.shared,
+                weather_id,
+                governor,
+                profiler,
+                cpu,
+                priority,
+            ),
+            name="RenderProcess",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        self.log.info(
+            f"Render process {self._process.pid} started, state in shared memory {self.shared.name}."
+        )
+
+    def set_mode(self, new_mode):
+        self._send("set_mode", new_mode)
+
+    def set_color(self, color):
+        self._send("set_color", color)
+
+    def set_intensity(self, intensity):
+        self._send("set_intensity", intensity)
+
+    def set_weather(self, weather_id):
+        self._send("set_weather", weather_id)
+
+    def set_pattern(self, index):
+        self._send("set_pattern", index)
+
+    def set_enabled(self, enabled):
+        self._send("set_enabled", enabled)
+
+    def refresh(self):
+        self._send("refresh")
+
+    def sync(self, epoch, seed):
+        self._send("sync", epoch, seed)
+
+    def toggle_profiler(self):
+        self._send("toggle_profiler")
+
+    def log_metrics(self):
+        self._send("log_metrics")
+
+    def add_show_receiver(self, callback):
+        """ Adds a callback called with the time each frame following a batch of calls is written """
+        self._receivers.append(callback)
+
+    def stats(self):
+        self.shared.frame_time(self._frame_time)
+        return self.shared.stats()
+
+    def frame(self):
+        return self.shared.frame()
+
+    def fileno(self):
+        """ Returns the file descriptor that becomes readable when the render process reports back """
+        return self._conn.fileno()
+
+    def receive(self):
+        """ Passes the frame times reported by the render process to the show receivers, without blocking """
+        try:
+            while self._conn.poll():
+                shown = self._conn.recv()
+                for callback in self._receivers:
+                    callback(shown)
+        except (EOFError, OSError):
+            self.log.error("Render process exited.")
+            self.alive = False
+
+    def close(self):
+        if self.alive:
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+        self._process.join(timeout=2)
+        self._conn.close()
+        self.shared.close(unlink=True)
+        self.log.info("Render process stopped.")
+
+    def _send(self, name, *args):
+        try:
+            self._conn.send((name, args))
+        except OSError:
+            self.log.error(f"Render process gone, {name} dropped.")
+            self.alive = False
+
+
+def _serve(conn, shared, weather_id, governor, profiler, cpu, priority):
+    """Runs a Renderer in the render process until None is received or the pipe closes."""
+    log = get_logger(__name__ + ".render")
+    # Signals are for the main process, which tells the render process what to do
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for signo in (signal.SIGINT, signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(signo, signal.SIG_IGN)
+    if cpu is not None:
+        os.sched_setaffinity(0, {int(cpu)})
+    if priority is not None:
+        os.setpriority(os.PRIO_PROCESS, 0, int(priority))
+
+    scheduler = Scheduler()
+    renderer = Renderer(scheduler, weather_id, governor, profiler)
+    shown = [None]
+    renderer.add_show_receiver(lambda when: shown.__setitem__(0, when))
+    frame_time = metrics.histogram("frame_time", FRAME_BUCKETS)
+    # Everything allocated so far lives as long as the process - keep it out of collections
+    gc.freeze()
+
+    selector = selectors.DefaultSelector()
+    selector.register(conn, selectors.EVENT_READ)
+    report = False
+    try:
+        while True:
+            if selector.select(scheduler.next_due()):
+                while conn.poll():
+                    call = conn.recv()
+                    if call is None:
+                        return
+                    name, args = call
+                    getattr(renderer, name)(*args)
+                    report = True
+
+            scheduler.run_due()
+
+            if shown[0] is not None:
+                shared.publish(renderer.stats(), pixels.buf, frame_time)
+                if report:
+                    conn.send(shown[0])
+                    report = False
+                shown[0] = None
+            else:
+                shared.publish(renderer.stats(), frame_time=frame_time)
+    except EOFError:
+        log.warning("Main process gone - stopping.")
+    finally:
+        selector.close()
+        renderer.close()
+        shared.close()
+        conn.close()
+
+
+def _restart(animation):
+    """Resets animation and every animation it drives, with sequences back on their first member."""
+    members = getattr(animation, "_members", None)
+    if members is not None:
+        if hasattr(animation, "activate"):
+            animation.activate(0)
+        for member in members:
+            _restart(member)
+    animation.reset()
+    animation.cycle_count = 0
+
+
+def _unstaged(name):
+    return lambda func: func
@@ -0,0 +1,174 @@
+""" scheduler v0.1
+Heap based timer scheduler for raspi-cloudlamp
+
+Owns all of the periodic work of the lamp (animation frames, weather polling,
+lightning selection, time of day jobs) so the main loop only has to ask when
+the next thing is due and run whatever has come due.
+"""
+
+import heapq
+from datetime import datetime, timedelta
+from time import monotonic
+
+from mylog import get_logger
+
+
+def seconds_until(hour, minute):
+    """(int, int) -> float
+
+    Returns the number of seconds until the next occurrence of hour:minute local time
+    """
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+class Timer(object):
+    """Class for a callback scheduled on a Scheduler
+
+    Returned by the Scheduler call_* functions and used as the handle for
+    reschedule() and cancel().
+    """
+
+    __slots__ = ("callback", "args", "interval", "daily", "name", "when", "_seq")
+
+    def __init__(self, callback, args, interval=None, daily=None, name=None):
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.daily = daily
+        self.name = name or getattr(callback, "__name__", "timer")
+        self.when = None
+        self._seq = None
+
+    def __repr__(self):
+        return f"<Timer {self.name} when={self.when}>"
+
+    @property
+    def active(self):
+        """ Returns True if the timer is waiting to fire """
+        return self.when is not None
+
+
+class Scheduler(object):
+    """Class for the Scheduler object
+
+    Use:
+        scheduler = Scheduler()
+        scheduler.call_every(3600, poll_weather)
+        scheduler.call_daily(23, 0, lamp_off)
+        while True:
+            selector.select(scheduler.next_due())
+            scheduler.run_due()
+    """
+
+    def __init__(self, clock=monotonic, stats_window=10.0):
+        """Initialize Scheduler class
+
+        param:clock         Function returning the current time in seconds
+        param:stats_window  Number of seconds fired_per_second is averaged over
+        """
+
+        self.log = get_logger(__name__ + ".Scheduler")
+        self._clock = clock
+        self._heap = []
+        self._seq = 0
+        self.fired = 0
+        self.stats_window = stats_window
+        self._window_start = clock()
+        self._window_fired = 0
+        self._rate = 0.0
+
+    # Scheduling functions
+    def call_at(self, when, callback, *args, name=None):
+        """ Runs callback(*args) once at clock time when """
+        timer = Timer(callback, args, name=name)
+        self._arm(timer, when)
+        return timer
+
+    def call_later(self, delay, callback, *args, name=None):
+        """ Runs callback(*args) once after delay seconds """
+        return self.call_at(self._clock() + delay, callback, *args, name=name)
+
+    def call_every(self, interval, callback, *args, delay=None, name=None):
+        """ Runs callback(*args) every interval seconds, first after delay seconds (default interval) """
+        timer = Timer(callback, args, interval=interval, name=name)
+        self._arm(timer, self._clock() + (interval if delay is None else delay))
+        return timer
+
+    def call_daily(self, hour, minute, callback, *args, name=None):
+        """ Runs callback(*args) every day at hour:minute local time """
+        timer = Timer(callback, args, daily=(hour, minute), name=name)
+        self._arm(timer, self._clock() + seconds_until(hour, minute))
+        return timer
+
+    def reschedule(self, timer, delay):
+        """ Moves timer (active or not) to fire after delay seconds, or cancels it if delay is None """
+        if delay is None:
+            self.cancel(timer)
+            return
+        self._arm(timer, self._clock() + delay)
+
+    def cancel(self, timer):
+        """ Stops timer from firing.  Its entry is dropped from the heap when it comes due """
+        timer.when = None
+        timer._seq = None
+
+    # Main loop functions
+    def next_due(self):
+        """ Returns the number of seconds until the next timer is due, or None if nothing is scheduled """
+        heap = self._heap
+        while heap and heap[0][1] != heap[0][2]._seq:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return max(0.0, heap[0][0] - self._clock())
+
+    def run_due(self):
+        """ Runs every timer that has come due and returns how many fired """
+        now = self._clock()
+        heap = self._heap
+        fired = 0
+        while heap and heap[0][0] <= now:
+            when, seq, timer = heapq.heappop(heap)
+            if seq != timer._seq:
+                continue
+            timer.when = None
+            timer._seq = None
+            # Re-arm repeating timers first so the callback can still move or cancel them
+            if timer.interval is not None:
+                self._arm(timer, max(when + timer.interval, now))
+            elif timer.daily is not None:
+                self._arm(timer, now + seconds_until(*timer.daily))
+            timer.callback(*timer.args)
+            fired += 1
+
+        self.fired += fired
+        self._window_fired += fired
+        self._roll(now)
+        return fired
+
+    @property
+    def fired_per_second(self):
+        """ Returns the average number of timers fired per second over the last stats_window """
+        self._roll(self._clock())
+        return self._rate
+
+    def __len__(self):
+        return sum(1 for entry in self._heap if entry[1] == entry[2]._seq)
+
+    # Helper functions
+    def _arm(self, timer, when):
+        self._seq += 1
+        timer.when = when
+        timer._seq = self._seq
+        heapq.heappush(self._heap, (when, self._seq, timer))
+
+    def _roll(self, now):
+        elapsed = now - self._window_start
+        if elapsed >= self.stats_window:
+            self._rate = self._window_fired / elapsed
+            self._window_start = now
+            self._window_fired = 0
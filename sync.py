@@ -0,0 +1,286 @@
+""" sync v0.1
+Leader/follower scene sync between lamps over UDP multicast
+
+One lamp is the leader.  Whenever its scene changes it starts a new phase of
+the scene (an epoch, with a new RNG seed - see Renderer.sync) and sends its
+State to the multicast group, and it repeats the State every interval seconds.
+Followers apply the State and sync their renderer to the same epoch, so every
+lamp draws the same frames and lightning at the same time.
+
+Each packet carries the leader's clock when it was sent.  A follower keeps the
+smallest (receive time - sent time) over the last window packets as the offset
+between the leader's clock and its own, which takes out the clock difference
+and all but the smallest network delay.  As the repeated packets carry the
+whole State, a lost packet is made up for by the next one; a follower that
+hears nothing for timeout seconds carries on with the scene it has.
+
+Packets are PACKET (45 bytes):
+
+    magic, version, sequence number, leader clock when sent, epoch, seed,
+    lightning picks since epoch, mode, enabled, pattern, weather id, color,
+    intensity
+
+Use:
+    leader = SyncLeader()
+    leader.update(state)            # on a scene change, then
+    scheduler.call_every(leader.interval, leader.send)
+
+    follower = SyncFollower()
+    selector.register(follower, selectors.EVENT_READ)
+    state = follower.receive()      # when readable - None if nothing new
+    renderer.sync(follower.to_local(state.epoch), state.seed)
+
+For several lamps on one machine (or testing on localhost) use interface
+"127.0.0.1"; every follower binds the port with SO_REUSEADDR.
+"""
+
+# Standard library imports
+import socket
+import struct
+from collections import deque, namedtuple
+from time import monotonic
+
+from mylog import get_logger
+
+GROUP = "239.255.42.99"
+PORT = 42099
+MAGIC = b"CLMP"
+VERSION = 1
+PACKET = struct.Struct("!4sBIddIIBBBH3sf")
+
+# The scene a leader sends.  epoch is on the leader's clock (time.monotonic()), and
+# color is None if the mode shows its own color
+State = namedtuple(
+    "State",
+    (
+        "epoch",
+        "seed",
+        "lightning",
+        "mode",
+        "enabled",
+        "pattern",
+        "weather_id",
+        "color",
+        "intensity",
+    ),
+)
+
+
+def pack(seq, sent, state):
+    """Returns the packet for state, numbered seq and sent at sent (leader clock)"""
+    return PACKET.pack(
+        MAGIC,
+        VERSION,
+        seq & 0xFFFFFFFF,
+        sent,
+        state.epoch,
+        state.seed & 0xFFFFFFFF,
+        state.lightning & 0xFFFFFFFF,
+        state.mode,
+        bool(state.enabled),
+        state.pattern,
+        # 0 when the condition isn't known yet
+        int(state.weather_id) if str(state.weather_id).isdigit() else 0,
+        bytes(state.color or (0, 0, 0)),
+        state.intensity,
+    )
+
+
+def unpack(data):
+    """(bytes) -> (int, float, State)
+
+    Returns the sequence number, sent time and State of a packet.
+    Raises ValueError if data is not a packet of this version.
+    """
+    if len(data) != PACKET.size:
+        raise ValueError(f"Packet of {len(data)} bytes, expected {PACKET.size}")
+    fields = PACKET.unpack(data)
+    if fields[0] != MAGIC or fields[1] != VERSION:
+        raise ValueError(f"Not a version {VERSION} sync packet")
+    seq, sent = fields[2:4]
+    (
+        epoch,
+        seed,
+        lightning,
+        mode,
+        enabled,
+        pattern,
+        weather_id,
+        color,
+        intensity,
+    ) = fields[4:]
+    state = State(
+        epoch,
+        seed,
+        lightning,
+        mode,
+        bool(enabled),
+        pattern,
+        weather_id,
+        tuple(color) if any(color) else None,
+        round(intensity, 3),
+    )
+    return seq, sent, state
+
+
+class SyncLeader(object):
+    """Class for the lamp the others follow
+
+    :param str group: Multicast group address (Default GROUP).
+    :param int port: UDP port (Default PORT).
+    :param str interface: Address of the interface to send on (Default any).
+    :param float interval: Seconds between repeats of the State (Default 0.5).
+    :param int ttl: Multicast hops, 1 to stay on the LAN (Default 1).
+    """
+
+    def __init__(
+        self, group=GROUP, port=PORT, interface="0.0.0.0", interval=0.5, ttl=1
+    ):
+        self.log = get_logger(__name__ + ".SyncLeader")
+        self.address = (group, port)
+        self.interval = interval
+        self.state = None
+        self.seq = 0
+        self.sent = 0
+        self.failed = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self._sock.setsockopt(
+            socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface)
+        )
+        self._sock.setblocking(False)
+        self.log.info(f"Leading on {group}:{port}.")
+
+    def update(self, state):
+        """ Sets the State to send, and sends it now """
+        self.state = state
+        self.send()
+
+    def send(self):
+        if self.state is None:
+            return
+        self.seq += 1
+        try:
+            self._sock.sendto(pack(self.seq, monotonic(), self.state), self.address)
+            self.sent += 1
+        except OSError as e:
+            # Followers carry on with what they have, and the next repeat may get through
+            self.failed += 1
+            if self.failed == 1:
+                self.log.warning(f"Sending to {self.address} failed:\n {e}")
+
+    def close(self):
+        self._sock.close()
+        self.log.info("SyncLeader stopped.")
+
+
+class SyncFollower(object):
+    """Class for a lamp following a SyncLeader
+
+    :param str group: Multicast group address (Default GROUP).
+    :param int port: UDP port (Default PORT).
+    :param str interface: Address of the interface to receive on (Default any).
+    :param int window: Packets the clock offset is estimated over (Default 16).
+    :param float timeout: Seconds without a packet before the leader is lost (Default 5.0).
+    """
+
+    def __init__(
+        self, group=GROUP, port=PORT, interface="0.0.0.0", window=16, timeout=5.0
+    ):
+        self.log = get_logger(__name__ + ".SyncFollower")
+        self.timeout = timeout
+        self.state = None
+        self.offset = None
+        self.jitter = 0.0
+        self.received = 0
+        self.lost = 0
+        self.invalid = 0
+        self.last_heard = None
+        self._samples = deque(maxlen=window)
+        self._seq = None
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._sock.bind(("", port))
+        self._sock.setsockopt(
+            socket.IPPROTO_IP,
+            socket.IP_ADD_MEMBERSHIP,
+            socket.inet_aton(group) + socket.inet_aton(interface),
+        )
+        self._sock.setblocking(False)
+        self.log.info(f"Following on {group}:{port}.")
+
+    def fileno(self):
+        """ Returns the file descriptor of the socket, for a selector """
+        return self._sock.fileno()
+
+    @property
+    def following(self):
+        """ Returns True if the leader has been heard from within timeout """
+        return (
+            self.last_heard is not None and monotonic() - self.last_heard < self.timeout
+        )
+
+    def receive(self):
+        """
+        Reads the packets waiting, without blocking.
+        :return: The newest State if its scene differs from the last one returned
+                 (lightning, which counts up through a scene, isn't compared), otherwise None.
+        """
+        newest = None
+        while True:
+            try:
+                data = self._sock.recv(PACKET.size + 1)
+            except BlockingIOError:
+                break
+            now = monotonic()
+            try:
+                seq, sent, state = unpack(data)
+            except ValueError as e:
+                self.invalid += 1
+                self.log.debug(f"Ignored packet: {e}")
+                continue
+            if not self._accept(seq):
+                continue
+            self.received += 1
+            if not self.following:
+                self.log.info("Leader found.")
+            self.last_heard = now
+            self._samples.append(now - sent)
+            newest = state
+        if newest is None:
+            return None
+        best = min(self._samples)
+        self.jitter = sorted(self._samples)[len(self._samples) // 2] - best
+        if self.offset is None or abs(best - self.offset) > 0.001:
+            self.log.debug(f"Leader clock offset {best:.6f}s")
+        self.offset = best
+        previous, self.state = self.state, newest
+        if previous is not None and newest._replace(lightning=0) == previous._replace(
+            lightning=0
+        ):
+            return None
+        return newest
+
+    def to_local(self, leader_time):
+        """ Returns leader_time (on the leader's clock) on this lamp's clock """
+        return leader_time + self.offset
+
+    def close(self):
+        self._sock.close()
+        self.log.info("SyncFollower stopped.")
+
+    def _accept(self, seq):
+        """ Returns False for a packet older than the last one accepted, counting the packets lost in between """
+        if self._seq is not None:
+            gap = (seq - self._seq) & 0xFFFFFFFF
+            if gap == 0 or gap >= 0x80000000:
+                # Repeated or reordered - unless the leader restarted and numbers from 1 again
+                if seq != 1:
+                    return False
+                gap = 1
+                self._samples.clear()
+            self.lost += gap - 1
+        self._seq = seq
+        return True
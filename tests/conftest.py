@@ -0,0 +1,94 @@
+""" conftest
+Shared fixtures for the raspi-cloudlamp tests
+
+The tests run on any Linux machine: the simulated pixel backend replaces the
+strip, and Upstream stands in for openweathermap.org on a local port.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+os.environ.setdefault("CLOUDLAMP_BACKEND", "sim")
+
+
+class Upstream(object):
+    """A stand-in for openweathermap.org serving canned JSON on a local port
+
+    responses maps a path ("/weather" or "/forecast") to the response body, or a
+    function of the zip called for each request.  Every request is recorded in
+    hits, and takes delay seconds to answer.  While down is set it answers 500.
+    """
+
+    def __init__(self, responses, delay=0.0):
+        self.responses = responses
+        self.delay = delay
+        self.down = False
+        self.hits = []
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer(("127.0.0.1", 0), _UpstreamHandler)
+        self._server.upstream = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def count(self, path=None):
+        """ Returns the number of requests made, for path if given """
+        with self._lock:
+            return sum(1 for hit in self.hits if path is None or hit[0] == path)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        upstream = self.server.upstream
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        with upstream._lock:
+            upstream.hits.append((url.path, query))
+        time.sleep(upstream.delay)
+        response = upstream.responses.get(url.path)
+        if upstream.down or response is None:
+            status, body = (500 if upstream.down else 404), b"{}"
+        else:
+            if callable(response):
+                response = response(query["zip"][0])
+            status, body = 200, json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+
+@pytest.fixture
+def upstream():
+    """ Yields a function creating an Upstream, closing them all afterwards """
+    servers = []
+
+    def create(responses, delay=0.0):
+        servers.append(Upstream(responses, delay))
+        return servers[-1]
+
+    yield create
+    for server in servers:
+        server.close()
@@ -0,0 +1,189 @@
+""" test_broker
+WeatherBroker against a canned upstream, driven by hundreds of Weather clients
+"""
+
+import threading
+
+import pytest
+import requests
+
+from weather.broker import WeatherBroker
+from weather.weather import Weather
+
+ZIPS = ("97007", "10001", "60601")
+CLIENTS = 200
+
+
+def condition(zipcode):
+    return {"weather": [{"id": 800 + ZIPS.index(zipcode[:5]), "main": "Clear"}]}
+
+
+def forecast(zipcode):
+    return {"list": [{"dt": 0, "weather": [{"id": 500, "main": "Rain"}]}]}
+
+
+@pytest.fixture
+def start(upstream):
+    """ Yields a function starting a WeatherBroker on a canned upstream, returning both """
+    brokers = []
+
+    def create(delay=0.2, **kwargs):
+        canned = upstream({"/weather": condition, "/forecast": forecast}, delay)
+        urls = {
+            "weather": canned.url + "/weather",
+            "forecast": canned.url + "/forecast",
+        }
+        broker = WeatherBroker("KEY", port=0, host="127.0.0.1", urls=urls, **kwargs)
+        broker.start()
+        brokers.append(broker)
+        return broker, canned
+
+    yield create
+    for broker in brokers:
+        broker.close()
+
+
+def lamps(broker, tmp_path, count=CLIENTS, forecast_every=0):
+    """Returns count Weather objects using broker, spread over ZIPS"""
+    address = f"http://127.0.0.1:{broker.address[1]}"
+    return [
+        Weather(
+            broker=address,
+            zipcode=ZIPS[i % len(ZIPS)],
+            forecast=bool(forecast_every) and i % forecast_every == 0,
+            # Not there, so nothing is fetched when the Weather is created
+            cache_file=str(tmp_path / "weather_cache.json"),
+        )
+        for i in range(count)
+    ]
+
+
+def age(broker, seconds):
+    """Makes every cached response, and every failure, seconds older"""
+    for entry in broker._entries.values():
+        entry.fetched -= seconds
+        entry.retry_at -= seconds
+
+
+def fetch_all(clients):
+    """Fetches on every client at once, returning the responses"""
+    results = [None] * len(clients)
+    barrier = threading.Barrier(len(clients))
+
+    def fetch(i):
+        barrier.wait()
+        results[i] = clients[i].fetch()
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_clients_share_one_fetch_per_location(start, tmp_path):
+    broker, canned = start(ttl=60)
+    clients = lamps(broker, tmp_path, forecast_every=4)
+
+    results = fetch_all(clients)
+
+    assert canned.count("/weather") == len(ZIPS)
+    assert canned.count("/forecast") == len(ZIPS)
+    for client, resp in zip(clients, results):
+        if client.forecast:
+            assert resp["list"][0]["weather"][0]["id"] == 500
+        else:
+            assert resp == condition(client.zipcode)
+        # Only the broker's requests count against the api quota
+        assert client.api_calls == 0
+
+
+def test_fresh_responses_are_served_from_the_cache(start, tmp_path):
+    broker, canned = start(ttl=60)
+    clients = lamps(broker, tmp_path)
+
+    fetch_all(clients)
+    fetch_all(clients)
+
+    assert canned.count() == len(ZIPS)
+
+
+def test_refetched_once_per_location_after_ttl(start, tmp_path):
+    broker, canned = start(ttl=60)
+    clients = lamps(broker, tmp_path)
+
+    fetch_all(clients)
+    age(broker, 50)
+    fetch_all(clients)
+    assert canned.count() == len(ZIPS)
+    age(broker, 10)
+    results = fetch_all(clients)
+
+    assert canned.count() == 2 * len(ZIPS)
+    assert all(resp is not None for resp in results)
+
+
+def test_stale_responses_while_upstream_is_down(start, tmp_path):
+    broker, canned = start(ttl=60, retry=30)
+    clients = lamps(broker, tmp_path)
+    fresh = fetch_all(clients)
+    age(broker, 60)
+    canned.down = True
+
+    # One failed attempt per location, and every client gets the last response
+    assert fetch_all(clients) == fresh
+    assert canned.count() == 2 * len(ZIPS)
+
+    # Not tried again until retry has passed
+    assert fetch_all(clients) == fresh
+    assert canned.count() == 2 * len(ZIPS)
+
+    age(broker, 30)
+    canned.down = False
+    assert fetch_all(clients) == fresh
+    assert canned.count() == 3 * len(ZIPS)
+
+
+def test_502_without_a_response(start, tmp_path):
+    broker, canned = start(delay=0.05, retry=60)
+    canned.down = True
+    clients = lamps(broker, tmp_path, count=30)
+
+    assert fetch_all(clients) == [None] * len(clients)
+    assert canned.count() == len(ZIPS)
+    status, _, _ = broker.get("weather", "97007", "us")
+    assert status == 502
+
+
+def test_invalid_requests_are_refused(start):
+    broker, canned = start()
+    address = f"http://127.0.0.1:{broker.address[1]}"
+
+    assert requests.get(f"{address}/weather?zip=97;007,us").status_code == 400
+    assert requests.get(f"{address}/weather?zip=97007").status_code == 400
+    assert requests.get(f"{address}/history?zip=97007,us").status_code == 404
+    assert canned.count() == 0
+
+
+def test_zip_and_country_are_normalised(start):
+    broker, canned = start(delay=0)
+
+    broker.get("weather", "97007", "US")
+    broker.get("weather", " 97007 ", "us")
+
+    assert canned.count() == 1
+
+
+def test_cache_is_capped_dropping_failed_locations_first(start):
+    broker, canned = start(delay=0, max_entries=2)
+
+    broker.get("weather", "97007", "us")
+    canned.responses["/weather"] = None  # answered 404
+    broker.get("weather", "99999", "us")
+    canned.responses["/weather"] = condition
+    broker.get("weather", "10001", "us")
+    assert sorted(key[1] for key in broker._entries) == ["10001", "97007"]
+
+    broker.get("weather", "60601", "us")
+    assert sorted(key[1] for key in broker._entries) == ["10001", "60601"]
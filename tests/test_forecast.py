@@ -0,0 +1,73 @@
+""" test_forecast
+Stepping through a canned forecast timeline locally
+"""
+
+from time import strftime
+
+import pytest
+
+import weather.weather as weather
+from cloud_animations.animations import weather_anim
+
+START = 1700000000
+STEP = 10800
+# Condition id of each 3 hour step, each shown by a different animation
+IDS = (800, 500, 601, 200)
+
+
+class Clock(object):
+    """Stands in for the time module in weather, with the time set by the test"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - START
+
+    strftime = staticmethod(strftime)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(START)
+    monkeypatch.setattr(weather, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def forecast(upstream, monkeypatch):
+    timeline = {
+        "list": [
+            {"dt": START + i * STEP, "weather": [{"id": id_, "main": str(id_)}]}
+            for i, id_ in enumerate(IDS)
+        ]
+    }
+    canned = upstream({"/forecast": timeline})
+    monkeypatch.setattr(weather, "FORECAST_URL", canned.url + "/forecast")
+    return canned
+
+
+def test_weather_anim_switches_at_each_boundary_without_a_request(clock, forecast):
+    lamp = weather.Weather(appid="KEY", forecast=True)
+    assert forecast.count() == 1
+    assert forecast.hits[0][1]["cnt"] == [str(weather.FORECAST_STEPS)]
+    assert weather_anim[str(lamp.id)] is weather_anim[str(IDS[0])]
+
+    for i, id_ in enumerate(IDS[1:], 1):
+        boundary = START + i * STEP
+        clock.now = boundary - 0.5
+        assert lamp.next_boundary == pytest.approx(clock.monotonic() + 0.5)
+        assert not lamp.advance()
+        assert weather_anim[str(lamp.id)] is weather_anim[str(IDS[i - 1])]
+
+        clock.now = boundary
+        assert lamp.advance()
+        assert lamp.id == id_
+        assert weather_anim[str(lamp.id)] is weather_anim[str(id_)]
+        assert weather_anim[str(lamp.id)] is not weather_anim[str(IDS[i - 1])]
+
+    assert lamp.next_boundary is None
+    assert forecast.count() == 1
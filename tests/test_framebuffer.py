@@ -0,0 +1,70 @@
+""" test_framebuffer
+FrameBuffer crossfades as written to the simulated strip
+"""
+
+import pytest
+
+import cloud_animations.framebuffer as framebuffer
+from cloud_animations.framebuffer import FrameBuffer
+from cloud_animations.simulated import SimulatedPixels
+
+N = 4
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(framebuffer, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def strip():
+    return SimulatedPixels(N, auto_write=False)
+
+
+def written(strip):
+    """Returns the first channel of the last frame written to strip"""
+    return strip.frames[-1][0]
+
+
+def test_crossfade_across_an_intensity_change_starts_from_the_frame_shown(clock, strip):
+    pixels = FrameBuffer(strip)
+    pixels.fill((200, 200, 200))
+    pixels.show()
+    assert written(strip) == 200
+
+    # A mode change with a dimmer intensity, as code_main applies a key press
+    pixels.crossfade(1.0)
+    pixels.intensity = 0.5
+    pixels.fill((100, 100, 100))
+    pixels.show()
+    assert written(strip) == 200
+
+    clock[0] += 0.5
+    pixels.show()
+    assert written(strip) == pytest.approx((200 + 50) / 2, abs=1)
+
+    clock[0] += 0.5
+    pixels.show()
+    assert written(strip) == 50
+    assert not pixels.fading
+
+
+def test_crossfade_restarted_mid_fade_starts_from_the_blend(clock, strip):
+    pixels = FrameBuffer(strip)
+    pixels.fill(0)
+    pixels.show()
+    pixels.crossfade(1.0)
+    pixels.fill((200, 200, 200))
+    clock[0] += 0.5
+    pixels.show()
+    assert written(strip) == 100
+
+    pixels.crossfade(1.0)
+    pixels.fill(0)
+    pixels.show()
+    assert written(strip) == 100
+    clock[0] += 1.0
+    pixels.show()
+    assert written(strip) == 0
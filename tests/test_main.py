@@ -0,0 +1,63 @@
+""" test_main
+The lamp started as a process with the simulated backend and a secrets file of the test's
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def condition(zipcode):
+    return {"weather": [{"id": 800, "main": "Clear"}]}
+
+
+@pytest.fixture
+def lamp(tmp_path):
+    """Yields a function starting code_main with secrets, stopping it afterwards"""
+    procs = []
+
+    def start(secrets):
+        secrets.setdefault("weather_cache", str(tmp_path / "weather_cache.json"))
+        (tmp_path / "secrets.py").write_text(f"secrets = {secrets!r}\n")
+        env = dict(os.environ, CLOUDLAMP_BACKEND="sim", PYTHONPATH=str(tmp_path))
+        with open(tmp_path / "lamp.log", "wb") as log:
+            procs.append(
+                subprocess.Popen(
+                    [sys.executable, os.path.join(ROOT, "code_main.py")],
+                    cwd=str(tmp_path),
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+            )
+        return procs[-1]
+
+    yield start
+    for proc in procs:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def test_lamp_with_only_a_broker_polls_it(lamp, upstream, tmp_path):
+    broker = upstream({"/weather": condition})
+    proc = lamp({"ow_broker": broker.url})
+
+    deadline = time.monotonic() + 20
+    while not broker.count("/weather") and time.monotonic() < deadline:
+        assert proc.poll() is None, (tmp_path / "lamp.log").read_text()
+        time.sleep(0.1)
+
+    # No cache yet, so nothing was fetched before the scheduler's first poll
+    assert broker.count("/weather") == 1, (tmp_path / "lamp.log").read_text()
+    assert broker.hits[0][1]["zip"] == ["97007,us"]
+    assert "appid" not in broker.hits[0][1]
@@ -0,0 +1,78 @@
+""" test_spi
+WS2812 SPI frames written to a pipe and a file standing in for the device
+"""
+
+import os
+
+from cloud_animations.spi import ENCODING, RESET_BYTES, SPIPixels, encode, encode_bits
+
+
+class Recorder(object):
+    """A file object recording every write() made to the file f"""
+
+    def __init__(self, f):
+        self.f = f
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return self.f.write(data)
+
+
+def decode(spi_bytes):
+    """Returns the color bytes of SPI bytes, checking every bit is sent as 110 or 100"""
+    colors = bytearray()
+    for i in range(0, len(spi_bytes), 3):
+        bits = int.from_bytes(spi_bytes[i : i + 3], "big")
+        byte = 0
+        for shift in range(21, -1, -3):
+            symbol = bits >> shift & 0b111
+            assert symbol in (0b110, 0b100)
+            byte = byte << 1 | (symbol == 0b110)
+        colors.append(byte)
+    return bytes(colors)
+
+
+def test_table_encoding_matches_bit_by_bit():
+    data = bytes(range(256))
+    assert encode(data) == encode_bits(data)
+    assert ENCODING.shape == (256, 3)
+    assert encode(b"\x00\xff") == b"\x92\x49\x24\xdb\x6d\xb6"
+
+
+def test_frame_goes_to_a_pipe_in_grb_order():
+    read_fd, write_fd = os.pipe()
+    with open(write_fd, "wb", buffering=0) as device:
+        strip = SPIPixels(3, device, auto_write=False)
+        strip[0] = (1, 2, 3)
+        strip[1] = (0xFF, 0x00, 0x80)
+        strip[2] = 0x102030
+        strip.show()
+    with open(read_fd, "rb") as pipe:
+        out = pipe.read()
+
+    assert len(out) == 1 + 9 * 3 + RESET_BYTES
+    # A low byte before the frame, and the strip latches on the low tail after it
+    assert out[0] == 0
+    assert out[-RESET_BYTES:] == bytes(RESET_BYTES)
+    assert decode(out[1 : 1 + 9 * 3]) == bytes(
+        (2, 1, 3, 0x00, 0xFF, 0x80, 0x20, 0x10, 0x30)
+    )
+
+
+def test_each_frame_is_a_single_write(tmp_path):
+    with open(tmp_path / "spidev", "wb", buffering=0) as f:
+        device = Recorder(f)
+        strip = SPIPixels(
+            48, device, pixel_order="RGB", brightness=0.5, auto_write=False
+        )
+        strip.fill((200, 100, 0))
+        strip.show()
+        strip.fill(0)
+        strip.show()
+
+    assert strip.writes == 2
+    assert [len(data) for data in device.writes] == [1 + 9 * 48 + RESET_BYTES] * 2
+    assert decode(device.writes[0][1 : 1 + 9 * 48]) == bytes((100, 50, 0)) * 48
+    assert decode(device.writes[1][1 : 1 + 9 * 48]) == bytes(3 * 48)
+    assert (tmp_path / "spidev").read_bytes() == b"".join(device.writes)
@@ -0,0 +1,123 @@
+""" test_sync
+Sync packets, and a leader and follower on the loopback interface
+"""
+
+import select
+from time import monotonic
+
+import pytest
+
+import sync
+
+# Off the default port, so a lamp running on the machine doesn't join in
+PORT = sync.PORT + 100
+
+STATE = sync.State(
+    epoch=1234.5,
+    seed=0xDEADBEEF,
+    lightning=7,
+    mode=3,
+    enabled=True,
+    pattern=2,
+    weather_id=800,
+    color=(255, 128, 0),
+    intensity=0.25,
+)
+
+
+def test_pack_unpack_round_trip():
+    seq, sent, state = sync.unpack(sync.pack(42, 99.25, STATE))
+    assert (seq, sent, state) == (42, 99.25, STATE)
+
+
+def test_unknown_color_and_weather_are_sent_as_zero():
+    packet = sync.pack(1, 0.0, STATE._replace(color=None, weather_id="def"))
+    assert len(packet) == sync.PACKET.size
+    _, _, state = sync.unpack(packet)
+    assert state.color is None
+    assert state.weather_id == 0
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        sync.pack(1, 0.0, STATE)[:-1],
+        b"XXXX" + sync.pack(1, 0.0, STATE)[4:],
+        sync.pack(1, 0.0, STATE)[:4] + b"\x09" + sync.pack(1, 0.0, STATE)[5:],
+    ],
+)
+def test_unpack_refuses_other_packets(data):
+    with pytest.raises(ValueError):
+        sync.unpack(data)
+
+
+@pytest.fixture
+def follower():
+    follower = sync.SyncFollower(port=PORT, interface="127.0.0.1")
+    yield follower
+    follower.close()
+
+
+@pytest.fixture
+def leader():
+    leader = sync.SyncLeader(port=PORT, interface="127.0.0.1")
+    yield leader
+    leader.close()
+
+
+def test_accept_counts_gaps_and_drops_reordered_packets(follower):
+    assert follower._accept(10)
+    assert follower._accept(11)
+    assert follower.lost == 0
+    assert follower._accept(14)
+    assert follower.lost == 2
+    # Late and repeated packets are dropped without counting as lost
+    assert not follower._accept(12)
+    assert not follower._accept(14)
+    assert follower.lost == 2
+    assert follower._accept(15)
+    assert follower.lost == 2
+
+
+def test_accept_wraps_the_sequence_number(follower):
+    assert follower._accept(0xFFFFFFFF)
+    assert follower._accept(0)
+    assert follower._accept(2)
+    assert follower.lost == 1
+
+
+def test_accept_restarted_leader_starts_over(follower):
+    follower._samples.extend((0.5, 0.6))
+    assert follower._accept(500)
+    assert follower._accept(1)
+    assert follower.lost == 0
+    assert not follower._samples
+    assert follower._accept(2)
+
+
+def receive(follower, timeout=2.0):
+    """Returns the State received by follower once its socket is readable"""
+    readable, _, _ = select.select([follower], [], [], timeout)
+    assert readable, "nothing received from the leader"
+    return follower.receive()
+
+
+def test_follower_takes_the_leaders_state_and_clock(leader, follower):
+    epoch = monotonic()
+    leader.update(STATE._replace(epoch=epoch))
+
+    state = receive(follower)
+    assert state == STATE._replace(epoch=epoch)
+    assert follower.following
+    # Both on this machine's clock, so the offset is the loopback delay
+    assert 0.0 <= follower.offset < 0.05
+    assert follower.to_local(epoch) == pytest.approx(epoch, abs=0.05)
+    assert follower.to_local(epoch) == epoch + follower.offset
+
+    # A repeat of the same scene, with more lightning, is not returned again
+    leader.update(STATE._replace(epoch=epoch, lightning=8))
+    assert receive(follower) is None
+    assert follower.state.lightning == 8
+    assert follower.received == 2
+    assert follower.lost == 0
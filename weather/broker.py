@@ -0,0 +1,311 @@
+""" broker v0.1
+Caching weather broker for a fleet of lamps
+
+Every lamp polling openweathermap.org for the same location spends the API
+quota once per lamp.  WeatherBroker makes the requests on their behalf and
+serves the responses over HTTP on the local network:
+
+    GET /weather?zip=97007,us       current condition
+    GET /forecast?zip=97007,us      48 hour forecast
+
+A response is kept for ttl seconds per location and endpoint, so however many
+lamps ask, the API is called at most once per ttl for each.  Requests for a
+location that arrive while its response is being fetched wait for that fetch
+instead of starting their own.  If a fetch fails the last response is served
+(stale) if there is one, and the API isn't tried again for that location for
+retry seconds; without one the broker answers 502.  At most max_entries
+locations are kept - those that never fetched are dropped first, then the least
+recently asked for.
+
+Lamps use the broker by giving Weather its address instead of an API key:
+    Weather(broker="http://192.168.1.10:8642")
+
+Run it on any machine on the LAN with the API key in secrets or OW_APPID:
+    python3 -m weather.broker --port 8642 --ttl 600
+"""
+
+# Standard library imports
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import requests
+
+from mylog import get_logger
+import metrics
+from .weather import API_URL, FORECAST_URL, FORECAST_STEPS
+
+BROKER_PORT = 8642
+# Seconds a response is served from the cache
+DEFAULT_TTL = 600
+# Seconds before a failed location is fetched again
+DEFAULT_RETRY = 60
+# Most endpoint/location responses kept
+DEFAULT_MAX_ENTRIES = 64
+
+# Accepted zip and country - anything else is refused rather than spent against the quota
+ZIP = re.compile(r"[0-9A-Za-z -]{1,10}")
+COUNTRY = re.compile(r"[A-Za-z]{2}")
+
+metrics.describe("weather_broker_requests", "Requests answered by result", "result")
+metrics.describe("weather_broker_fetches", "API requests made by result", "result")
+metrics.describe("weather_broker_evictions", "Locations dropped from the cache")
+
+
+class WeatherBroker(object):
+    """Class used to serve cached openweathermap.org responses to many lamps
+
+    :param str appid: openweathermap.org API key.
+    :param int port: TCP port to serve on (Default BROKER_PORT).
+    :param str host: Address to serve on (Default all interfaces).
+    :param float ttl: Seconds a response is served from the cache (Default DEFAULT_TTL).
+    :param float retry: Seconds before a failed location is fetched again (Default DEFAULT_RETRY).
+    :param int max_entries: Most endpoint/location responses kept (Default DEFAULT_MAX_ENTRIES).
+    :param tuple timeout: (connect, read) timeout of each API request (Default (5, 15)).
+    :param session: requests.Session to fetch with (Default a new one).
+    :param dict urls: Upstream URL for each endpoint (Default the openweathermap.org ones).
+
+    Use:
+        broker = WeatherBroker(appid)
+        broker.start()
+        ...
+        broker.close()
+    """
+
+    def __init__(
+        self,
+        appid,
+        port=BROKER_PORT,
+        host="0.0.0.0",
+        ttl=DEFAULT_TTL,
+        retry=DEFAULT_RETRY,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        timeout=(5, 15),
+        session=None,
+        urls=None,
+    ):
+        self.log = get_logger(__name__ + ".WeatherBroker")
+        self.appid = appid
+        self.ttl = ttl
+        self.retry = retry
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
+        self.urls = urls or {"weather": API_URL, "forecast": FORECAST_URL}
+        # Least recently asked for first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), _BrokerHandler)
+        self._server.broker = self
+        self.address = self._server.server_address
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="WeatherBroker", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        self.log.info(
+            f"WeatherBroker listening on {self.address[0]}:{self.address[1]}."
+        )
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=1)
+        self.session.close()
+        self.log.info("WeatherBroker stopped.")
+
+    def get(self, endpoint, zipcode, country):
+        """(WeatherBroker, str, str, str) -> (int, bytes, float)
+
+        Returns the HTTP status, JSON body and age in seconds of the response for
+        endpoint at zipcode,country - from the cache if it is fresh, otherwise
+        fetched (once, however many callers are waiting for it).
+        """
+
+        key = (endpoint, " ".join(zipcode.upper().split()), country.lower())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                if len(self._entries) > self.max_entries:
+                    self._evict()
+            else:
+                self._entries.move_to_end(key)
+        # Callers for the same key queue here while one of them fetches
+        with entry.lock:
+            now = time.monotonic()
+            if entry.body is not None and now - entry.fetched < self.ttl:
+                result = "hit"
+            elif now < entry.retry_at:
+                result = "stale" if entry.body is not None else "error"
+            else:
+                body = self._fetch(key)
+                if body is not None:
+                    entry.body, entry.fetched = body, time.monotonic()
+                    result = "miss"
+                else:
+                    entry.retry_at = time.monotonic() + self.retry
+                    result = "stale" if entry.body is not None else "error"
+            metrics.counter(f"weather_broker_requests.{result}").inc()
+            if entry.body is None:
+                return 502, b'{"cod": 502, "message": "upstream unavailable"}', 0.0
+            return 200, entry.body, time.monotonic() - entry.fetched
+
+    def _evict(self):
+        """Drops an entry that never fetched, or else the least recently asked for one - call with _lock held"""
+        for key, entry in self._entries.items():
+            if entry.body is None and entry.retry_at:
+                break
+        else:
+            key = next(iter(self._entries))
+        del self._entries[key]
+        metrics.counter("weather_broker_evictions").inc()
+
+    def _fetch(self, key):
+        """Requests key from the API, returning the JSON body or None if the request failed"""
+        endpoint, zipcode, country = key
+        params = {
+            "units": "imperial",
+            "zip": f"{zipcode},{country}",
+            "appid": self.appid,
+        }
+        if endpoint == "forecast":
+            params["cnt"] = FORECAST_STEPS
+        url = self.urls[endpoint] + "?" + urlencode(params, safe=",")
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                self.log.warning(
+                    f"GET {endpoint} {zipcode},{country} failed with response code: {response.status_code}"
+                )
+                response.close()
+                metrics.counter("weather_broker_fetches.failed").inc()
+                return None
+            body = response.content
+            response.close()
+            # Only ever cache and serve something a lamp can decode
+            json.loads(body)
+        except requests.RequestException as e:
+            self.log.warning(f"Failed to get {endpoint} {zipcode},{country}: {e}")
+            metrics.counter("weather_broker_fetches.failed").inc()
+            return None
+        except ValueError as e:
+            self.log.warning(f"Bad response for {endpoint} {zipcode},{country}: {e}")
+            metrics.counter("weather_broker_fetches.failed").inc()
+            return None
+        metrics.counter("weather_broker_fetches.ok").inc()
+        self.log.debug(f"Fetched {endpoint} {zipcode},{country}")
+        return body
+
+
+class _Entry(object):
+    """The cached response for one endpoint and location"""
+
+    __slots__ = ("lock", "body", "fetched", "retry_at")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.body = None
+        self.fetched = 0.0
+        self.retry_at = 0.0
+
+
+class _BrokerHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a lamp's pooled session reuses its connection
+    protocol_version = "HTTP/1.1"
+    # Drop clients that stall instead of holding a thread
+    timeout = 30
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.strip("/")
+        location = parse_qs(url.query).get("zip", [""])[0]
+        zipcode, _, country = location.partition(",")
+        if endpoint not in self.server.broker.urls:
+            self._reply(404, b'{"cod": 404, "message": "not found"}')
+            return
+        if not ZIP.fullmatch(zipcode) or not COUNTRY.fullmatch(country):
+            metrics.counter("weather_broker_requests.invalid").inc()
+            self._reply(400, b'{"cod": 400, "message": "expected zip=<zip>,<country>"}')
+            return
+        status, body, age = self.server.broker.get(endpoint, zipcode, country)
+        self._reply(status, body, age)
+
+    def _reply(self, status, body, age=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if age is not None and status == 200:
+            self.send_header("Age", str(int(age)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.broker.log.debug(format % args)
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    # Room for a whole fleet connecting at once
+    request_queue_size = 128
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=BROKER_PORT, help="TCP port")
+    parser.add_argument("--host", default="0.0.0.0", help="address to serve on")
+    parser.add_argument(
+        "--ttl", type=float, default=DEFAULT_TTL, help="seconds responses are cached"
+    )
+    parser.add_argument(
+        "--retry",
+        type=float,
+        default=DEFAULT_RETRY,
+        help="seconds before a failed location is fetched again",
+    )
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="most endpoint/location responses kept",
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, help="serve metrics on this localhost port"
+    )
+    args = parser.parse_args()
+
+    appid = os.environ.get("OW_APPID")
+    if appid is None:
+        from secrets import secrets
+
+        appid = secrets["ow_appid"]
+    broker = WeatherBroker(
+        appid,
+        port=args.port,
+        host=args.host,
+        ttl=args.ttl,
+        retry=args.retry,
+        max_entries=args.max_entries,
+    )
+    if args.metrics_port is not None:
+        metrics.MetricsServer(args.metrics_port).start()
+    broker.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,94 @@
-""" weather v0.2
+""" weather v0.3
 Weather handler for raspi-cloudlamp
 """
 
 # Imports
+import json
+import os
+import queue
+import random
+import threading
 import time
+from urllib.parse import urlencode
 from mylog import get_logger
+import metrics
 import requests
 
+# Bucket upper bounds in seconds for the fetch time histogram
+FETCH_BUCKETS = (0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0)
+
+API_URL = "https://api.openweathermap.org/data/2.5/weather"
+FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+FORECAST_STEPS = 16  # 3 hour steps - 48 hours of forecast
+
 
 class Weather(object):
     """Class used to retrieve current weather conditions
 
     Uses the openweathermap.org api: api.openweathermap.org/data/2.5
+    In forecast mode the 48 hour forecast is fetched instead, and the current
+    condition is stepped along the forecast timeline locally by advance().
+    With a broker the responses come from a WeatherBroker (weather.broker) on
+    the local network instead, which holds the API key.
     """
 
     def __init__(
         self,
-        wifi=requests,
+        wifi=None,
         zipcode="97007",
         country="us",
         interval=3600,
         appid=None,
+        timeout=(5, 15),
+        cache_file=None,
+        retry_base=60,
+        retry_cap=3600,
+        forecast=False,
+        broker=None,
     ):
-        """(Weather, Wifi, str, str, int, str) -> NoneType
+        """(Weather, Wifi, str, str, int, str, tuple, str, int, int, bool, str) -> NoneType
 
         Initializes a weather class object - uses zipcode and country to determine location to get weather for.
+        wifi defaults to a keep-alive requests.Session owned by the Weather object.
+        timeout is the (connect, read) timeout in seconds for each request.
+        Failed requests are retried after an exponential backoff (with jitter) starting at
+        retry_base seconds and capped at retry_cap seconds.
+        If cache_file is set, the last response is kept there and loaded at startup instead
+        of making a blocking request; the next update is only due once the cache is interval old.
+        If forecast is set, each update fetches the forecast timeline (use an interval of a few hours).
+        If broker is set (e.g. "http://192.168.1.10:8642"), requests go to that WeatherBroker
+        and no appid is needed.
         """
 
         self.log = get_logger(__name__ + ".Weather")
         self.is_active = False
-        self.wifi = wifi  # adafruit wifimanager object
+        self._url = None
+        self.broker = broker
+        if wifi is None:
+            wifi = requests.Session()
+        self.wifi = wifi  # requests.Session or adafruit wifimanager object
         self.zipcode = zipcode
         self.country = country
         self.appid = appid
         self.current = "Undefined"
         self.id = "Undefined"
         self.interval = interval
+        self.timeout = timeout
+        self.cache_file = cache_file
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.failures = 0
+        self.api_calls = 0
+        self._api_calls_today = 0
+        self._api_day = None
+        self._api_lock = threading.Lock()
+        self.forecast = forecast
+        self._timeline = []
         self._next_update = time.monotonic()
-        self.update(True)
+        if cache_file is None or not self.configured:
+            self.update(True)
+        elif not self.load_cache():
+            self.log.info("No usable weather cache - update due now.")
         self.log.info("Instance of Weather class created.")
 
     @property
@@ -71,6 +122,7 @@ class Weather(object):
                 return
 
         self._zipcode = value
+        self._url = None
         self.is_active = True
         self.log.info(f"Zip code set: {self._zipcode}")
 
@@ -93,6 +145,7 @@ class Weather(object):
         # Need some value checking code here
         self.log.info(f"Setting country: {value}")
         self._country = value
+        self._url = None
 
     @property
     def appid(self):
@@ -111,9 +164,10 @@ class Weather(object):
         """
 
         self.log.info(f"Setting appid: {value}")
-        if value is None:
+        if value is None and self.broker is None:
             self.log.warning("No API Key provided")
         self._appid = value
+        self._url = None
 
     @property
     def current(self):
@@ -143,6 +197,75 @@ class Weather(object):
     def id(self, value):
         self._id = value
 
+    @property
+    def api_calls_today(self):
+        """(Weather) -> int
+
+        Returns the number of requests made to the api since local midnight
+        """
+
+        with self._api_lock:
+            self._roll_api_day()
+            return self._api_calls_today
+
+    @property
+    def configured(self):
+        """(Weather) -> bool
+
+        Returns True if the Weather object can make requests - it has an appid or a broker
+        """
+
+        return self.appid is not None or self.broker is not None
+
+    @property
+    def next_update(self):
+        """(Weather) -> float
+
+        Returns the time.monotonic() time at which the next update is due
+        """
+
+        return self._next_update
+
+    @property
+    def next_boundary(self):
+        """(Weather) -> float
+
+        Returns the time.monotonic() time of the next forecast timeline entry, or None
+        """
+
+        now = time.time()
+        for dt, _, _ in self._timeline:
+            if dt > now:
+                return time.monotonic() + (dt - now)
+        return None
+
+    def advance(self):
+        """(Weather) -> bool
+
+        Sets the current condition from the forecast timeline entry in effect now
+        Returns True if the condition has changed.  Does not make a request.
+        """
+
+        if not self._timeline:
+            return False
+        now = time.time()
+        _, new_id, new_condition = self._timeline[0]
+        for dt, entry_id, entry_condition in self._timeline:
+            if dt > now:
+                break
+            new_id, new_condition = entry_id, entry_condition
+        return self._set_condition(new_id, new_condition)
+
+    def due(self, force=False):
+        """(Weather, bool) -> bool
+
+        Returns True if an update is due (always True if force is set)
+        """
+
+        if force:
+            return True
+        return self.configured and time.monotonic() >= self._next_update
+
     def update(self, force=False):
         """(Weather) -> NoneType
 
@@ -151,8 +274,7 @@ class Weather(object):
         """
 
         self.log.debug("Calling Weather.update() - before time check")
-        now = time.monotonic()
-        if (now < self._next_update or self.appid is None) and not force:
+        if not self.due(force):
             return False
 
         if force:
@@ -160,60 +282,344 @@ class Weather(object):
         else:
             self.log.debug("Calling Weather.update() - enough time has passed")
 
-        if self.appid is None:
-            self.log.warning("API Key not set - defaulting to clear condition")
-            self.current = "Clear"
-            self.id = "800"
-            self._next_update = now + self.interval
-            return False
+        self.prepare()
+        return self.apply(self.fetch())
 
-        url = (
-            "https://api.openweathermap.org/data/2.5/weather?units=imperial&zip="
-            + self.zipcode
-            + ","
-            + self.country
-            + "&appid="
-            + self.appid
-        )
+    def fetch(self):
+        """(Weather) -> dict
+
+        Requests the current condition from the api and returns the decoded response,
+        or None if the request failed.  Only changes the request counters (under a
+        lock), so it is safe to call from a WeatherWorker thread once prepare() has
+        been called on the main thread.
+        """
 
+        if not self.configured:
+            self.log.warning("API Key not set - defaulting to clear condition")
+            return {"weather": [{"main": "Clear", "id": "800"}]}
+
+        url = self._url if self._url is not None else self._build_url()
+        if self.broker is None:
+            # The broker's own requests are what count against the api quota
+            self._count_api_call()
         try:
             self.log.debug("Attempting to get response . . .")
-            response = self.wifi.get(url)
+            response = self.wifi.get(url, timeout=self.timeout)
             if response.status_code != 200:
                 self.log.warning(
                     f"GET Failed with response code: {response.status_code}"
                 )
                 response.close()
-                self._next_update = now + 600  # Try again in 10 minutes
-                return False
+                return None
             resp = response.json()
             response.close()
+        except requests.RequestException as e:
+            self.log.warning(f"Failed to get data: {e}")
+            return None
         except (ValueError, RuntimeError) as e:
             self.log.exception(f"Failed to get data:\n {e}")
             # self.wifi.reset()
-            self._next_update = now + 600  # Try again in 10 minutes
+            return None
+
+        return resp
+
+    def prepare(self):
+        """(Weather) -> NoneType
+
+        Builds the request URL if the location or key has changed since the last
+        one was built, so a fetch() on another thread only reads it
+        """
+
+        if self._url is None and self.configured:
+            self._url = self._build_url()
+
+    def apply(self, resp):
+        """(Weather, dict) -> bool
+
+        Updates the Weather object from a fetch() response and saves it to the cache
+        Returns True if the condition has changed
+        """
+
+        changed = self._apply(resp)
+        if resp is not None and self.configured:
+            self.save_cache(resp)
+        return changed
+
+    def load_cache(self):
+        """(Weather) -> bool
+
+        Loads the last response for this zipcode/country from cache_file
+        Returns True if a cached response was applied.  The next update is due
+        interval seconds after the cached response was fetched.
+        """
+
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            self.log.warning(f"Could not read weather cache {self.cache_file}: {e}")
+            return False
+
+        if not isinstance(cache, dict) or cache.get("key") != self._cache_key():
+            self.log.info("Weather cache is for a different location - ignoring.")
+            return False
+
+        try:
+            age = time.time() - float(cache["fetched"])
+            self._apply(cache["response"])
+        except (KeyError, TypeError, IndexError, ValueError) as e:
+            self.log.warning(f"Weather cache {self.cache_file} is malformed: {e!r}")
+            # _apply may have pushed the next update back - it is due now
+            self._next_update = time.monotonic()
+            return False
+        self._next_update = time.monotonic() + max(0, self.interval - age)
+        self.log.info(
+            f"Loaded weather from cache: {self.id},{self.current} ({age:.0f}s old)"
+        )
+        return True
+
+    def save_cache(self, resp):
+        """(Weather, dict) -> NoneType
+
+        Writes resp and the time it was fetched to cache_file
+        """
+
+        if self.cache_file is None:
+            return
+        cache = {"key": self._cache_key(), "fetched": time.time(), "response": resp}
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            self.log.warning(f"Could not write weather cache {self.cache_file}: {e}")
+
+    def close(self):
+        """(Weather) -> NoneType
+
+        Closes the pooled connections of the Weather object's session
+        """
+
+        close = getattr(self.wifi, "close", None)
+        if close is not None:
+            close()
+
+    def _count_api_call(self):
+        """Counts a request against the api, and against today's calls."""
+        with self._api_lock:
+            self._roll_api_day()
+            self.api_calls += 1
+            self._api_calls_today += 1
+
+    def _roll_api_day(self):
+        """Resets today's calls at local midnight - call with _api_lock held."""
+        today = time.strftime("%Y-%m-%d")
+        if today != self._api_day:
+            self._api_day = today
+            self._api_calls_today = 0
+
+    def _build_url(self):
+        if self.broker is not None:
+            endpoint = "forecast" if self.forecast else "weather"
+            query = urlencode({"zip": f"{self.zipcode},{self.country}"}, safe=",")
+            return f"{self.broker.rstrip('/')}/{endpoint}?{query}"
+        params = {
+            "units": "imperial",
+            "zip": f"{self.zipcode},{self.country}",
+            "appid": self.appid,
+        }
+        if self.forecast:
+            params["cnt"] = FORECAST_STEPS
+            return FORECAST_URL + "?" + urlencode(params, safe=",")
+        return API_URL + "?" + urlencode(params, safe=",")
+
+    def _retry_delay(self):
+        """(Weather) -> float
+
+        Returns the number of seconds to wait after self.failures consecutive failures:
+        exponential backoff from retry_base capped at retry_cap, with jitter over the upper half
+        """
+
+        delay = min(self.retry_cap, self.retry_base * 2 ** (self.failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _cache_key(self):
+        endpoint = "forecast" if self.forecast else "weather"
+        return f"{self.zipcode},{self.country},{endpoint}"
+
+    def _apply(self, resp):
+        now = time.monotonic()
+        if resp is None:
+            self.failures += 1
+            delay = self._retry_delay()
+            self.log.info(
+                f"Update failed {self.failures} time(s), retry in {delay:.0f}s"
+            )
+            self._next_update = now + delay
             return False
 
+        self.failures = 0
+        self._next_update = now + self.interval
+        if "list" in resp:
+            self._timeline = sorted(
+                (entry["dt"], entry["weather"][0]["id"], entry["weather"][0]["main"])
+                for entry in resp["list"]
+            )
+            self.log.debug(f"Retrieved forecast with {len(self._timeline)} entries")
+            return self.advance()
+
         new_condition = resp["weather"][0]["main"]
         new_id = resp["weather"][0]["id"]
         self.log.debug(f"Retrieved weather condition update: {new_condition}")
+        return self._set_condition(new_id, new_condition)
+
+    def _set_condition(self, new_id, new_condition):
         if self.id == new_id:
             # No Change, we'll try again in another self.interval
             self.log.debug(
                 f"Condition unchanged. Current: {self.id},{self.current} New: {new_id},{new_condition}"
             )
-            self._next_update = now + self.interval
             return False
-        else:
-            # Condition changed, let's update it and return True
-            self.log.info(
-                f"Condition changed: Current: {self.id},{self.current} New: {new_id},{new_condition}"
+
+        # Condition changed, let's update it and return True
+        self.log.info(
+            f"Condition changed: Current: {self.id},{self.current} New: {new_id},{new_condition}"
+        )
+        self.current = new_condition
+        self.id = new_id
+        return True
+
+
+class WeatherWorker(object):
+    """Class used to run Weather.fetch() on a background thread
+
+    Results are handed back through a queue, and a byte is written to a pipe
+    for each one so the main loop can wait on the worker with select.
+
+    Use:
+        worker = WeatherWorker(weather)
+        worker.start()
+        selector.register(worker, selectors.EVENT_READ)
+        if weather.due():
+            worker.request()
+        for resp in worker.completed():
+            weather.apply(resp)
+    """
+
+    def __init__(self, weather):
+        """(WeatherWorker, Weather) -> NoneType
+
+        Initializes a worker that fetches on behalf of the weather object
+        """
+
+        self.log = get_logger(__name__ + ".WeatherWorker")
+        self.weather = weather
+        self.pending = False
+        self.fetches = 0
+        self.failures = 0
+        self.last_latency = None
+        self.total_latency = 0.0
+        self._requests = queue.Queue(maxsize=1)
+        self._results = queue.Queue()
+        self._read_fd, self._write_fd = os.pipe()
+        # Held while writing to the pipe, so close() can't close it under the thread
+        self._pipe_lock = threading.Lock()
+        self._closed = False
+        os.set_blocking(self._read_fd, False)
+        self._thread = threading.Thread(
+            target=self._run, name="WeatherWorker", daemon=True
+        )
+
+    @property
+    def average_latency(self):
+        """(WeatherWorker) -> float
+
+        Returns the average time in seconds taken by a fetch
+        """
+
+        if self.fetches == 0:
+            return None
+        return self.total_latency / self.fetches
+
+    def start(self):
+        self._thread.start()
+        self.log.info("WeatherWorker started.")
+
+    def request(self):
+        """(WeatherWorker) -> bool
+
+        Asks the worker to fetch the weather.  Returns False if a fetch is already pending
+        """
+
+        if self.pending:
+            return False
+        self.weather.prepare()
+        self.pending = True
+        self._requests.put_nowait(True)
+        return True
+
+    def completed(self):
+        """(WeatherWorker) -> generator
+
+        Yields the responses (or None for a failed fetch) of completed fetches without blocking
+        """
+
+        try:
+            while os.read(self._read_fd, 64):
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            try:
+                resp = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self.pending = False
+            yield resp
+
+    def fileno(self):
+        """ Returns the file descriptor that becomes readable when a fetch completes """
+        return self._read_fd
+
+    def close(self):
+        self._requests.put(None)
+        # A fetch in progress can outlast the join - the thread then finds the pipe closed and stops
+        self._thread.join(timeout=1)
+        with self._pipe_lock:
+            self._closed = True
+            os.close(self._read_fd)
+            os.close(self._write_fd)
+        self.log.info("WeatherWorker stopped.")
+
+    def _run(self):
+        while self._requests.get() is not None:
+            start = time.monotonic()
+            try:
+                resp = self.weather.fetch()
+            except Exception as e:
+                self.log.exception(f"Weather fetch raised:\n {e}")
+                resp = None
+            latency = time.monotonic() - start
+
+            self.fetches += 1
+            self.last_latency = latency
+            self.total_latency += latency
+            metrics.histogram("weather_fetch", FETCH_BUCKETS).observe(latency)
+            if resp is None:
+                self.failures += 1
+                metrics.counter("weather_fetches.failed").inc()
+            else:
+                metrics.counter("weather_fetches.ok").inc()
+            self.log.debug(
+                f"Fetch took {latency:.2f}s ({self.failures}/{self.fetches} failed)"
             )
-            self.current = new_condition
-            self.id = new_id
-            self._next_update = now + self.interval
-            return True
 
-        self.log.critical("Weather.update() got to the end without returning")
-        self._next_update = now + self.interval
-        return False
+            self._results.put(resp)
+            with self._pipe_lock:
+                if self._closed:
+                    return
+                os.write(self._write_fd, b"\0")